@@ -1,7 +1,310 @@
-from flask import Flask
+"""
+Web process: the keep-alive route plus a read-only JSON API for dashboards
+and stream overlays.
+
+    GET /api/<guild_id>/leaderboard?page=1&per_page=25
+    GET /api/<guild_id>/teams
+    GET /api/<guild_id>/players/<user_id>
+    GET /api/<guild_id>/players/<user_id>/events?cursor=...
+    GET /api/<guild_id>/search?q=cooking&cursor=...
+
+Every response is rendered once from the guild's Snapshot (see snapshot.py)
+and kept, JSON and gzip bodies side by side, until a change notification
+for that guild arrives (see notify.py). Responses carry an ETag, so a
+client polling with If-None-Match gets a 304 until the data changes.
+
+Flask handlers run in worker threads; the database pool, the change
+listener and all cached responses live on one asyncio loop in a background
+thread, started on the first API request.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from flask import Flask, Response, request
+from notify import ChangeListener
+from queries import create_pool, search_args
+from snapshot import build_snapshot
 
 app = Flask('')
 
+GZIP_MIN_SIZE = 512
+MAX_AGE = int(os.getenv("API_MAX_AGE", "2"))
+REQUEST_TIMEOUT = 10
+MAX_PER_PAGE = 100
+
+class Rendered:
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, data):
+        self.body = json.dumps(data, separators=(",", ":"), default=str).encode()
+        self.gzipped = gzip.compress(self.body, 6) if len(self.body) >= GZIP_MIN_SIZE else None
+        # Derived from the content, so every worker and process agrees on it.
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+
+class GuildView:
+    """A guild's snapshot and the responses rendered from it, replaced as a whole on change."""
+
+    def __init__(self, snapshot, max_rendered=256):
+        self.snapshot = snapshot
+        self.max_rendered = max_rendered
+        self.rendered = OrderedDict()
+
+    def get(self, key):
+        rendered = self.rendered.get(key)
+        if rendered is not None:
+            self.rendered.move_to_end(key)
+        return rendered
+
+    def put(self, key, rendered):
+        self.rendered[key] = rendered
+        while len(self.rendered) > self.max_rendered:
+            self.rendered.popitem(last=False)
+
+class StatsAPI:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.loop = None
+        self.pool = None
+        self.changes = None
+        self.views = {}
+        self.generations = {}
+        self.building = {}
+        self._starting = threading.Lock()
+
+    def start(self):
+        """
+        Start the API loop thread (once) and connect on it. A failed or timed
+        out connect is retried on the same loop by the next request.
+        """
+        with self._starting:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="stats-api", daemon=True).start()
+            if self.changes is not None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._connect(), self.loop)
+            try:
+                future.result(REQUEST_TIMEOUT)
+            except BaseException:
+                future.cancel()
+                raise
+
+    async def _connect(self):
+        # Whatever succeeded on an earlier attempt is kept.
+        if self.pool is None:
+            self.pool = await create_pool(
+                self.dsn, min_size=1, max_size=int(os.getenv("WEB_POOL_MAX_SIZE", "4"))
+            )
+        changes = ChangeListener(self.dsn)
+        changes.subscribe(self.on_db_change)
+        try:
+            await changes.start()
+        except BaseException:
+            await changes.close()
+            raise
+        self.changes = changes
+
+    def call(self, coro):
+        """Run coro on the API loop from a request thread and wait for its result."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(REQUEST_TIMEOUT)
+
+    def on_db_change(self, change):
+        # Ranks depend on every player, so any change drops the guild's whole view.
+        if change.guild_id is None:
+            for guild_id in list(self.views) + list(self.building):
+                self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+            self.views.clear()
+            return
+        self.generations[change.guild_id] = self.generations.get(change.guild_id, 0) + 1
+        self.views.pop(change.guild_id, None)
+
+    async def view(self, guild_id):
+        view = self.views.get(guild_id)
+        if view is not None:
+            return view
+        task = self.building.get(guild_id)
+        if task is None:
+            task = self.building[guild_id] = asyncio.ensure_future(self._build(guild_id))
+        return await asyncio.shield(task)
+
+    async def _build(self, guild_id):
+        generation = self.generations.get(guild_id, 0)
+        try:
+            async with self.pool.acquire() as conn:
+                view = GuildView(await build_snapshot(conn, guild_id))
+        finally:
+            del self.building[guild_id]
+        # A change that arrived mid-build means this snapshot may already be stale:
+        # serve it to the requests waiting on it, but don't keep it.
+        if self.generations.get(guild_id, 0) == generation:
+            self.views[guild_id] = view
+        return view
+
+    async def render(self, guild_id, key, build):
+        view = await self.view(guild_id)
+        rendered = view.get(key)
+        if rendered is None:
+            rendered = Rendered(await build(view.snapshot))
+            view.put(key, rendered)
+        return rendered
+
+    async def leaderboard(self, guild_id, page, per_page):
+        async def build(snapshot):
+            return {
+                "guild_id": str(guild_id),
+                "page": page,
+                "pages": snapshot.pages(per_page),
+                "players": [
+                    {
+                        "rank": row["rank"],
+                        "user_id": row["user_id"],
+                        "wins": row["wins"],
+                        "br_placements": list(row["br_placements"]),
+                    }
+                    for row in snapshot.page(page, per_page)
+                ],
+            }
+        return await self.render(guild_id, ("leaderboard", page, per_page), build)
+
+    async def teams(self, guild_id):
+        async def build(snapshot):
+            return {
+                "guild_id": str(guild_id),
+                "teams": [
+                    {
+                        "rank": rank,
+                        "name": team["name"],
+                        "emoji": team["emoji"],
+                        "points": team["points"],
+                        "wins": team["wins"],
+                        "br_placements": list(team["br_placements"]),
+                        "members": list(team["members"]),
+                    }
+                    for rank, team in zip(snapshot.team_ranks, snapshot.teams)
+                ],
+            }
+        return await self.render(guild_id, ("teams",), build)
+
+    async def player(self, guild_id, user_id):
+        async def build(snapshot):
+            row = snapshot.player(user_id)
+            if row is None:
+                return None
+            async with self.pool.acquire() as conn:
+                stats = await conn.fetchrow_named("user_stats", guild_id, user_id)
+            return {
+                "guild_id": str(guild_id),
+                "user_id": user_id,
+                "rank": row["rank"],
+                "wins": row["wins"],
+                "marathon_wins": row["marathon_wins"],
+                "br_placements": list(row["br_placements"]),
+                "event_count": stats["event_count"] if stats else 0,
+                "recent_events": list(stats["recent_events"]) if stats else [],
+            }
+        return await self.render(guild_id, ("player", user_id), build)
+
+    async def history(self, guild_id, user_id, after, limit=100):
+        async def build(snapshot):
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch_named("user_history", guild_id, user_id, after, limit + 1)
+            page = rows[:limit]
+            return {
+                "guild_id": str(guild_id),
+                "user_id": user_id,
+                "events": [row["event_name"] for row in page],
+                "next_cursor": str(page[-1]["id"]) if len(rows) > limit else None,
+            }
+        return await self.render(guild_id, ("history", user_id, after), build)
+
+    async def search(self, guild_id, term, after, limit=25):
+        async def build(snapshot):
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch_named("search_events", guild_id, *search_args(term, after), limit + 1)
+            page = rows[:limit]
+            cursor = None
+            if len(rows) > limit:
+                cursor = f"{page[-1]['sort_date'].isoformat()}.{page[-1]['id']}"
+            return {
+                "guild_id": str(guild_id),
+                "query": term,
+                "results": [
+                    {"user_id": row["user_id"], "event_name": row["event_name"]}
+                    for row in page
+                ],
+                "next_cursor": cursor,
+            }
+        return await self.render(guild_id, ("search", term, after), build)
+
+api = StatsAPI(os.getenv("DATABASE_URL"))
+
+def respond(rendered):
+    response = Response(mimetype="application/json")
+    response.set_etag(rendered.etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    if request.if_none_match.contains_weak(rendered.etag):
+        response.status_code = 304
+    elif rendered.gzipped is not None and request.accept_encodings["gzip"]:
+        response.set_data(rendered.gzipped)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.set_data(rendered.body)
+    return response
+
+def error(status, message):
+    return Response(json.dumps({"error": message}), status=status, mimetype="application/json")
+
+def serve(coro):
+    if not api.dsn:
+        coro.close()
+        return error(503, "DATABASE_URL is not configured")
+    rendered = api.call(coro)
+    if rendered.body == b"null":
+        return error(404, "not found")
+    return respond(rendered)
+
 @app.route('/')
 def home():
     return "I'm alive!"
+
+@app.route('/api/<int:guild_id>/leaderboard')
+def leaderboard(guild_id):
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = min(MAX_PER_PAGE, max(1, request.args.get("per_page", 25, type=int)))
+    return serve(api.leaderboard(guild_id, page, per_page))
+
+@app.route('/api/<int:guild_id>/teams')
+def teams(guild_id):
+    return serve(api.teams(guild_id))
+
+@app.route('/api/<int:guild_id>/players/<int:user_id>')
+def player(guild_id, user_id):
+    return serve(api.player(guild_id, str(user_id)))
+
+@app.route('/api/<int:guild_id>/players/<int:user_id>/events')
+def history(guild_id, user_id):
+    after = request.args.get("cursor", 0, type=int)
+    return serve(api.history(guild_id, str(user_id), after))
+
+@app.route('/api/<int:guild_id>/search')
+def search(guild_id):
+    term = request.args.get("q", "").strip()
+    if not term:
+        return error(400, "q is required")
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            sort_date, entry_id = cursor.split(".")
+            after = (date.fromisoformat(sort_date), int(entry_id))
+        except ValueError:
+            return error(400, "invalid cursor")
+    return serve(api.search(guild_id, term, after))
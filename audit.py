@@ -0,0 +1,131 @@
+"""
+Win recalculation and consistency audit for a guild's stats.
+
+Wins are derived from event_entries the same way everywhere: every recorded
+event counts, minus every battle royal placement other than 1st, never below
+zero. recalc_wins() applies that as one UPDATE; audit_stats() streams the
+stats table through a server-side cursor and reports rows that disagree.
+"""
+import asyncio
+import logging
+import time
+from queries import lock_guild_writes
+
+logger = logging.getLogger(__name__)
+
+EXPECTED = """
+    SELECT user_id,
+           GREATEST(0,
+               COUNT(*) FILTER (WHERE event_name IS NOT NULL)
+               - COUNT(*) FILTER (WHERE substring(br_placement FROM '[0-9]+')::int <> 1)
+           )::int AS wins,
+           COUNT(br_placement)::int AS br_count,
+           COUNT(event_name)::int AS event_count,
+           COUNT(*) FILTER (WHERE event_name IS NULL AND br_placement IS NOT NULL)::int AS orphan_placements
+    FROM event_entries
+    WHERE guild_id = $1 {where}
+    GROUP BY user_id
+"""
+
+# Users without any entries are reset to 0. Rows already correct are left
+# alone so the stats triggers only see real changes.
+RECALC_WINS = """
+    UPDATE stats s SET wins = COALESCE(x.wins, 0)
+    FROM stats t
+    LEFT JOIN ({expected}) x ON x.user_id = t.user_id
+    WHERE t.guild_id = s.guild_id AND t.user_id = s.user_id
+      AND s.guild_id = $1 {where}
+      AND s.wins IS DISTINCT FROM COALESCE(x.wins, 0)
+    RETURNING s.user_id, s.wins
+"""
+
+RECALC_ALL = RECALC_WINS.format(expected=EXPECTED.format(where=""), where="")
+RECALC_USER = RECALC_WINS.format(expected=EXPECTED.format(where="AND user_id = $2"), where="AND s.user_id = $2")
+
+AUDIT_QUERY = """
+    SELECT s.user_id, s.wins, s.br_count, s.event_count,
+           COALESCE(x.wins, 0) AS expected_wins,
+           COALESCE(x.br_count, 0) AS expected_br_count,
+           COALESCE(x.event_count, 0) AS expected_event_count,
+           COALESCE(x.orphan_placements, 0) AS orphan_placements
+    FROM stats s
+    LEFT JOIN LATERAL ({expected}) x ON true
+    WHERE s.guild_id = $1
+    ORDER BY s.user_id
+""".format(expected=EXPECTED.format(where="AND user_id = s.user_id"))
+
+CHECKS = {
+    "wins": "stored wins differ from event history",
+    "br_count": "stored BR count differs from placements",
+    "event_count": "stored event count differs from event history",
+    "orphan_placements": "placements without an event",
+}
+
+async def recalc_wins(conn, guild_id, user_id=None):
+    """
+    Recompute stored wins from event_entries for one user or the whole guild.
+    Returns the (user_id, wins) rows that changed.
+    """
+    async with conn.transaction():
+        if user_id is not None:
+            await lock_guild_writes(conn, [guild_id])
+            return await conn.fetch(RECALC_USER, guild_id, user_id)
+        # Registrations committing mid-update would be missed by the aggregate;
+        # only this guild's registrations wait.
+        await lock_guild_writes(conn, [guild_id], exclusive=True)
+        return await conn.fetch(RECALC_ALL, guild_id)
+
+class AuditReport:
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.scanned = 0
+        self.flagged = {check: [] for check in CHECKS}
+        self.elapsed = 0.0
+
+    def check(self, row):
+        if row["wins"] != row["expected_wins"]:
+            self.flagged["wins"].append((row["user_id"], row["wins"], row["expected_wins"]))
+        if row["br_count"] != row["expected_br_count"]:
+            self.flagged["br_count"].append((row["user_id"], row["br_count"], row["expected_br_count"]))
+        if row["event_count"] != row["expected_event_count"]:
+            self.flagged["event_count"].append((row["user_id"], row["event_count"], row["expected_event_count"]))
+        if row["orphan_placements"]:
+            self.flagged["orphan_placements"].append((row["user_id"], row["orphan_placements"], 0))
+
+    @property
+    def users(self):
+        return {user_id for rows in self.flagged.values() for user_id, _, _ in rows}
+
+    def summary(self, sample=5):
+        lines = [f"Audited {self.scanned} players in {self.elapsed:.1f}s; {len(self.users)} need attention."]
+        for check, description in CHECKS.items():
+            rows = self.flagged[check]
+            if not rows:
+                continue
+            lines.append(f"- {description}: {len(rows)}")
+            for user_id, stored, expected in rows[:sample]:
+                lines.append(f"  • <@{user_id}>: {stored} (expected {expected})")
+        return "\n".join(lines)
+
+async def audit_stats(pool, guild_id, batch_size=500):
+    """
+    Check every stats row in a guild against its event history. Rows are read
+    batch_size at a time from a server-side cursor inside one read-only
+    snapshot, so memory stays flat and other commands keep running in between.
+    """
+    report = AuditReport(guild_id)
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await conn.cursor(AUDIT_QUERY, guild_id)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    report.check(row)
+                report.scanned += len(rows)
+                await asyncio.sleep(0)
+    report.elapsed = time.perf_counter() - started
+    logger.info(f"Stats audit of guild {guild_id}: {report.scanned} rows, {len(report.users)} flagged in {report.elapsed:.1f}s")
+    return report
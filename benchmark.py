@@ -0,0 +1,276 @@
+"""
+Offline benchmark for the EventCog/TeamCog commands.
+
+Seeds a local Postgres with synthetic players modelled on stats.json and runs
+the hot commands through stub Context/Guild/Member objects, reporting latency,
+query count and peak Python memory per command. Nothing talks to Discord.
+
+    BENCH_DATABASE_URL=postgresql://localhost/evr_bench python benchmark.py --scales 1000 10000 100000
+
+The target database is wiped on every run, so never point it at production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+import asyncpg
+
+from bot import EventCog, GAME_DATA
+from team_cog import TeamCog, PRESET_TEAMS
+from standings import StandingsCog
+from event_utils import entry_record, format_event, is_br_event
+from perf import PerfRecorder, InstrumentedPool, Sample, current_sample
+from members import MemberResolver
+from render_cache import RenderCache
+from schema import migrate
+from queries import create_pool
+
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+
+GUILD_ID = 1
+PLACEMENTS = ["1st", "2nd", "3rd", "4th", "5th", "6th"]
+
+class FakeMember:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f"Player {user_id}"
+        self.mention = f"<@{user_id}>"
+        self.guild_permissions = None
+
+class FakeGuild:
+    """Every id resolves from the local member cache, like a fully chunked guild."""
+
+    def __init__(self):
+        self.id = GUILD_ID
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.setdefault(user_id, FakeMember(user_id))
+
+    async def fetch_member(self, user_id):
+        return self.get_member(user_id)
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, cache=True, presences=False):
+        return [self.get_member(int(u)) for u in (user_ids or [])]
+
+class FakeResponse:
+    async def edit_message(self, **kwargs):
+        pass
+
+    async def send_message(self, *args, **kwargs):
+        pass
+
+    async def defer(self, **kwargs):
+        pass
+
+class FakeInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.response = FakeResponse()
+
+class FakeContext:
+    def __init__(self, bot, guild, author):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+class FakeBot:
+    def __init__(self):
+        self.perf = PerfRecorder()
+        self.members = MemberResolver(self.perf)
+        self.renders = RenderCache()
+        self.changes = None
+        self.cogs = {}
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+def event_names():
+    names = set()
+    if os.path.exists("stats.json"):
+        with open("stats.json") as f:
+            for data in json.load(f).values():
+                for event in data.get("events", []):
+                    names.add(event.split("(Date:")[0].strip())
+    for games in GAME_DATA.values():
+        names.update(name.title() for name in games)
+    names.update(["Battle Royal", "Mini-Royal", "Co-operative Royal"])
+    return sorted(names)
+
+def synthetic_rows(user_count, rng):
+    """Yield (stats_row, [event_entries rows]) with a long-tailed history length."""
+    names = event_names()
+    for n in range(user_count):
+        uid = str(10**17 + n)
+        history = min(400, int(rng.paretovariate(1.3)) + rng.randint(0, 3))
+        entries = []
+        wins = 0
+        for _ in range(history):
+            name = rng.choice(names)
+            date = f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.choice((2024, 2025))}"
+            placement = rng.choice(PLACEMENTS) if is_br_event(name) else None
+            wins += 1 if placement in (None, "1st") else 0
+            entries.append(entry_record(uid, format_event(name, date), placement))
+        yield (uid, wins, 0), entries
+
+async def seed(dsn, user_count, seed_value=1234):
+    rng = random.Random(seed_value)
+    conn = await asyncpg.connect(dsn)
+    try:
+        await migrate(conn, home_guild_id=GUILD_ID)
+        await conn.execute("TRUNCATE event_entries, team_members, stats, teams RESTART IDENTITY CASCADE")
+        await conn.executemany("INSERT INTO teams (guild_id, name) VALUES ($1, $2)", [(GUILD_ID, t) for t in PRESET_TEAMS])
+
+        stats_rows, entry_rows, member_rows = [], [], []
+        veteran, longest = None, -1
+        for stats_row, entries in synthetic_rows(user_count, rng):
+            stats_rows.append(stats_row)
+            entry_rows.extend((GUILD_ID, *entry) for entry in entries)
+            if len(entries) > longest:
+                veteran, longest = stats_row[0], len(entries)
+            if rng.random() < 0.1:
+                member_rows.append((GUILD_ID, stats_row[0], rng.randint(1, len(PRESET_TEAMS))))
+
+        await conn.copy_records_to_table(
+            "stats", records=[(GUILD_ID, *row) for row in stats_rows],
+            columns=["guild_id", "user_id", "wins", "marathon_wins"]
+        )
+        await conn.copy_records_to_table(
+            "event_entries", records=entry_rows,
+            columns=["guild_id", "user_id", "event_name", "event", "event_date", "br_placement"]
+        )
+        await conn.copy_records_to_table("team_members", records=member_rows, columns=["guild_id", "user_id", "team_id"])
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    return [row[0] for row in stats_rows], len(entry_rows), veteran
+
+async def measure(name, coro_factory, runs):
+    """
+    Time `runs` invocations, then one more under tracemalloc for peak memory
+    (tracing skews latency, so it is kept out of the timed runs). The first
+    run is cold, so max_ms covers cache misses and p50_ms the steady state.
+    """
+    latencies, queries = [], []
+    for _ in range(runs):
+        token = current_sample.set(Sample(name))
+        started = time.perf_counter()
+        try:
+            await coro_factory()
+        finally:
+            latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(current_sample.get().queries)
+            current_sample.reset(token)
+
+    tracemalloc.start()
+    try:
+        await coro_factory()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "command": name,
+        "p50_ms": statistics.median(latencies),
+        "max_ms": max(latencies),
+        "queries": max(queries),
+        "peak_kib": peak / 1024,
+    }
+
+def last_view(ctx):
+    for _, kwargs in reversed(ctx.sent):
+        if "view" in kwargs:
+            return kwargs["view"]
+    return None
+
+async def run_scale(dsn, user_count, runs):
+    user_ids, entry_count, veteran = await seed(dsn, user_count)
+    raw_pool = await create_pool(dsn)
+    try:
+        bot = FakeBot()
+        pool = InstrumentedPool(raw_pool, bot.perf)
+        event_cog = EventCog(bot, pool)
+        team_cog = TeamCog(bot, pool)
+        await team_cog.cog_load()
+        # The refresh loops stay stopped; snapshots are built on first read.
+        bot.pool = pool
+        bot.cogs = {"EventCog": event_cog, "TeamCog": team_cog, "StandingsCog": StandingsCog(bot)}
+
+        guild = FakeGuild()
+        player = guild.get_member(int(veteran))
+        roster = [f"<@{uid}>" for uid in user_ids[:30]]
+
+        def ctx():
+            return FakeContext(bot, guild, player)
+
+        async def flip(factory):
+            c = ctx()
+            await factory(c)
+            view = last_view(c)
+            if view is not None and not view.next_button.disabled:
+                await view.next_button.callback(FakeInteraction(player))
+
+        cases = [
+            ("stats", lambda: EventCog.stats.callback(event_cog, ctx(), None)),
+            ("stats page 2", lambda: flip(lambda c: EventCog.stats.callback(event_cog, c, None))),
+            ("stats @user", lambda: EventCog.stats.callback(event_cog, ctx(), player)),
+            ("rank", lambda: StandingsCog.rank.callback(bot.cogs["StandingsCog"], ctx(), player)),
+            ("search", lambda: EventCog.search.callback(event_cog, ctx(), game_name="Cooking")),
+            ("search page 2", lambda: flip(lambda c: EventCog.search.callback(event_cog, c, game_name="Cooking"))),
+            ("variety", lambda: EventCog.variety.callback(event_cog, ctx(), player)),
+            ("allevents", lambda: EventCog.allevents.callback(event_cog, ctx(), player)),
+            ("allevents page 2", lambda: flip(lambda c: EventCog.allevents.callback(event_cog, c, player))),
+            ("bulkreg x30", lambda: EventCog.bulkreg.callback(event_cog, ctx(), *roster, "Benchmark Night", "1/1/2030")),
+            ("leaderboard", lambda: TeamCog.leaderboard.callback(team_cog, ctx())),
+            ("teamstats", lambda: TeamCog.teamstats.callback(team_cog, ctx(), team_name=PRESET_TEAMS[0])),
+        ]
+        results = []
+        for name, factory in cases:
+            results.append(await measure(name, factory, runs))
+        return {"users": user_count, "entries": entry_count, "results": results}
+    finally:
+        await raw_pool.close()
+
+def check_local(dsn):
+    host = urlparse(dsn).hostname or ""
+    if host not in LOCAL_HOSTS and not host.startswith("/"):
+        raise SystemExit(f"Refusing to benchmark against non-local host {host!r}.")
+
+def print_report(report):
+    print(f"\n== {report['users']:,} users / {report['entries']:,} event entries ==")
+    print(f"{'command':<16}{'p50 ms':>10}{'max ms':>10}{'queries':>10}{'peak KiB':>12}")
+    for r in report["results"]:
+        print(f"{r['command']:<16}{r['p50_ms']:>10.1f}{r['max_ms']:>10.1f}{r['queries']:>10}{r['peak_kib']:>12.0f}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file for comparison between builds")
+    args = parser.parse_args()
+
+    dsn = os.getenv("BENCH_DATABASE_URL", "postgresql://localhost/evr_bench")
+    check_local(dsn)
+
+    reports = []
+    for scale in args.scales:
+        report = await run_scale(dsn, scale, args.runs)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
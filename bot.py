@@ -1,7 +1,7 @@
 import discord
 from discord import ui
-from flask import Flask
 from threading import Thread
+from app import app
 from discord.ext import commands
 import os
 import logging
@@ -9,14 +9,22 @@ import asyncio
 import json
 import asyncpg
 import re
+from typing import Literal, Union
 from team_cog import TeamCog
-from datetime import datetime
-
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "I'm alive!"
+from standings import StandingsCog
+from members import MemberResolver
+from stats_cache import StatsCache
+from perf import PerfRecorder, InstrumentedPool
+from event_utils import EVENT_ALIASES, normalize_event, format_event, entry_record
+from schema import migrate, check_query_plans
+from queries import create_pool, lock_guild_writes, search_args
+from locks import KeyedLocks
+from prefix_index import PrefixIndex
+from game_index import GameIndex
+from write_behind import WriteBehindQueue, new_op_id
+from audit import recalc_wins, audit_stats
+from notify import ChangeListener
+from render_cache import RenderCache
 
 def run():
     app.run(host='0.0.0.0', port=8080)
@@ -70,11 +78,7 @@ GAME_DATA = {
     }
 }
 
-EVENT_ALIASES = {
-    "Pizzeria Survival": ["Pizzeria Survival Hard", "Pizzeria Survival Normal", "Pizzeria Survival Easy", "Twisted Pizzeria"],
-    "Locate the Spy": ["Locate the Spy", "LtS Doubles", "LtS Legacy"],
-    "Battle Royal": ["Battle Royal", "Mini-Royal", "Co-operative Royal", "Prize Battle Royal $10"] 
-}
+GAME_INDEX = GameIndex(GAME_DATA, EVENT_ALIASES)
 
 class GameModal(discord.ui.Modal, title="Look up a Game"):
     game_name = discord.ui.TextInput(
@@ -84,50 +88,145 @@ class GameModal(discord.ui.Modal, title="Look up a Game"):
     )
 
     async def on_submit(self, interaction: discord.Interaction):
-        name = self.game_name.value.lower()
-        found = None
-        for category, games in GAME_DATA.items():
-            if name in games:
-                found = (category, games[name])
-                break
-
-        if found:
-            category, desc = found
+        match = GAME_INDEX.best(self.game_name.value)
+
+        if match and match.key:
             embed = discord.Embed(
-                title=f"EM Game Index: {name.title()}",
-                description=desc,
+                title=f"EM Game Index: {match.key.title()}",
+                description=GAME_DATA[match.category][match.key],
                 color=discord.Color.dark_teal()
             )
-            embed.set_footer(text=f"Category: {category}")
+            footer = f"Category: {match.category}"
+            if match.score < 1:
+                footer += f" · Closest match for \"{self.game_name.value}\""
+            embed.set_footer(text=footer)
             await interaction.response.send_message(embed=embed, ephemeral=True)
         else:
-            await interaction.response.send_message(
-                f"❌ Could not find a game called **{self.game_name.value}**.",
-                ephemeral=True
-            )
+            suggestions = [m.key.title() for m in GAME_INDEX.lookup(self.game_name.value, limit=3) if m.key]
+            message = f"❌ Could not find a game called **{self.game_name.value}**."
+            if suggestions:
+                message += " Did you mean: " + ", ".join(f"**{s}**" for s in dict.fromkeys(suggestions)) + "?"
+            await interaction.response.send_message(message, ephemeral=True)
 
-def parse_event_date(event_str):
-    match = re.search(r"\(Date:\s*(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\)", event_str)
-    if match:
-        month = int(match.group(1))
-        day = int(match.group(2))
-        year = int(match.group(3)) if match.group(3) else datetime.now().year
-        return datetime(year, month, day)
-    else:
-        return datetime.min
-
-def normalize_event(raw_event: str) -> str:
-    """Normalize event name, merge aliases, and strip date info."""
-    event = raw_event.split("(Date:")[0].split("(")[0].strip()
-    for main_event, variants in EVENT_ALIASES.items():
-        if event in variants:
-            return main_event
-    return event
+MENTION_RE = re.compile(r"^(?:<@!?(\d{15,20})>|(\d{15,20}))$")
 
 class EventCog(commands.Cog):
     def __init__(self, bot, pool):
         self.bot = bot
         self.pool = pool
+        self.caches = {}
+        self.locks = KeyedLocks(bot.perf)
+        self.names = {}
+        self.names_building = {}
+        self.write_behind = None
+        self.audits = {}
+
+    async def cog_load(self):
+        if self.bot.changes:
+            self.bot.changes.subscribe(self.on_db_change)
+        journal = os.getenv("WRITE_BEHIND_JOURNAL", "write_behind.journal")
+        if os.getenv("WRITE_BEHIND") or os.path.exists(journal):
+            self.write_behind = WriteBehindQueue(
+                self.write_entries, journal,
+                max_delay_ms=int(os.getenv("WRITE_BEHIND_MS", "250")),
+                max_ops=int(os.getenv("WRITE_BEHIND_OPS", "100"))
+            )
+            # Starting replays whatever an earlier run left in the journal.
+            await self.write_behind.start()
+            if not os.getenv("WRITE_BEHIND"):
+                try:
+                    await self.write_behind.flush()
+                except Exception:
+                    # Keep the queue (and its journal) running so the ops are retried
+                    # in the background instead of blocking startup.
+                    self.bot.logger.exception(
+                        f"Could not drain the write-behind journal {journal}; keeping write-behind on until it drains"
+                    )
+                else:
+                    await self.write_behind.close()
+                    os.remove(journal)
+                    self.write_behind = None
+
+    async def cog_unload(self):
+        if self.bot.changes:
+            self.bot.changes.unsubscribe(self.on_db_change)
+        for task in self.names_building.values():
+            task.cancel()
+        if self.write_behind:
+            await self.write_behind.close()
+
+    def on_db_change(self, change):
+        """Drop cached stats touched by a write from any process (see notify.py)."""
+        if change.table not in (None, "stats", "event_entries"):
+            return
+        if change.guild_id is None:
+            for cache in self.caches.values():
+                cache.clear()
+            return
+        cache = self.caches.get(change.guild_id)
+        if cache is None:
+            return
+        if change.user_ids is None:
+            cache.clear()
+        else:
+            cache.invalidate(*change.user_ids)
+
+    async def cog_check(self, ctx):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        return True
+
+    def cache_for(self, guild_id):
+        cache = self.caches.get(guild_id)
+        if cache is None:
+            # Rendered pages of this guild go stale with every write that invalidates its stats.
+            cache = self.caches[guild_id] = StatsCache(on_invalidate=lambda: self.bot.renders.bump(guild_id))
+        return cache
+
+    def names_for(self, guild_id):
+        """
+        The autocomplete index of a guild: its recorded events plus GAME_DATA
+        and EVENT_ALIASES. Returns None until it has been built; the first call
+        for a guild starts the build and later calls share it.
+        """
+        names = self.names.get(guild_id)
+        if names is None and guild_id not in self.names_building:
+            self.names_building[guild_id] = asyncio.create_task(self.build_names(guild_id))
+        return names
+
+    async def build_names(self, guild_id):
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT event, COUNT(*) AS entries FROM event_entries
+                    WHERE guild_id = $1 AND event IS NOT NULL
+                    GROUP BY event
+                    """,
+                    guild_id
+                )
+            names = PrefixIndex()
+            for row in rows:
+                names.add(row["event"], row["entries"])
+            for games in GAME_DATA.values():
+                for game in games:
+                    names.add(game.title())
+            for main_event, variants in EVENT_ALIASES.items():
+                names.add(main_event)
+                for variant in variants:
+                    names.add(variant)
+            self.names[guild_id] = names
+        except Exception:
+            # The next autocomplete request for the guild tries again.
+            self.bot.logger.exception(f"Building the autocomplete index for guild {guild_id} failed")
+        finally:
+            del self.names_building[guild_id]
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Build every guild's index up front so autocomplete never waits on it.
+        for guild in self.bot.guilds:
+            self.names_for(guild.id)
 
     class ListView(ui.View):
         def __init__(self, ctx):
@@ -139,6 +238,7 @@ class EventCog(commands.Cog):
                     "# __Bot Commands__\n"
                     "- **!stats** - Displays the stats of all users\n"
                     "- **!stats [@user]** - Displays the stats of a specific user\n"
+                    "- **!rank [@user]** - Shows your (or a user's) leaderboard rank and team rank\n"
                     "- **!index** — Show list of game modes (reply with name to see description)\n"
                     "- **!search <game name>** — Show winners of a specific game mode\n"
                     "- **!allevents [@user]** - Lists every event registered under a user\n"
@@ -146,7 +246,7 @@ class EventCog(commands.Cog):
                 )),
                 ("Team Commands", (
                     "# __Team Commands__\n"
-                    "- **!join <team_name>** - Join a preset team (Chaos, Revel, Hearth, Honor). Must have at least one event.\n"
+                    "- **!join <team_name>** - Join one of this server's teams. Must have at least one event.\n"
                     "- **!leave** - Leave your current team.\n"
                     "- **!teamstats [team_name]** - Show stats of a team or your own team if no name provided.\n"
                     "- **!leaderboard** - Show leaderboard of all teams by points.\n"
@@ -162,7 +262,10 @@ class EventCog(commands.Cog):
                     "- **!removereg** - Remove a specific entry rather than the most recent\n"
                     " `• Example: !regremove \"Cooking\" \"8/20/2025\" @User`\n"
                     "- **!clearall [@user]** — Clear all stats for a user\n"
-                    "- **!clearrec [@user]** — Clear most recent stat for a user"
+                    "- **!clearrec [@user]** — Clear most recent stat for a user\n"
+                    "- **!recalc [@user | all]** — Recompute wins from event history\n"
+                    "- **!audit** — Check every player's totals against their event history\n"
+                    "- **!teamadd <name> [emoji]** / **!teamemoji <name> [emoji]** / **!teamremove <name>** — Manage this server's teams"
                 )),
                 ("Secret Commands", (
                     "# __Secret Commands__\n"
@@ -181,6 +284,9 @@ class EventCog(commands.Cog):
             pass
 
         async def get_embed(self):
+            return await self.ctx.bot.renders.render("list", None, None, self.page, self.build_embed)
+
+        def build_embed(self):
             title, text = self.pages[self.page]
             embed = discord.Embed(
                 title=f"{title} (Page {self.page + 1}/{len(self.pages)})",
@@ -201,56 +307,114 @@ class EventCog(commands.Cog):
             embed = await self.get_embed()
             await interaction.response.edit_message(embed=embed, view=self)
 
-    async def save_user_stats(self, uid, wins, br_placements, events, marathon_wins):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO stats (user_id, wins, br_placements, events, marathon_wins)
-                VALUES ($1, $2, $3, $4, $5)
-                ON CONFLICT (user_id) DO UPDATE
-                SET wins = EXCLUDED.wins,
-                    br_placements = EXCLUDED.br_placements,
-                    events = EXCLUDED.events,
-                    marathon_wins = EXCLUDED.marathon_wins
-                """,
-                uid, wins, br_placements, events, marathon_wins
-            )
-
-    async def get_stats(self):
+    async def get_user_stats(self, guild_id, user_id):
+        await self.settle(guild_id, user_id)
+        cache = self.cache_for(guild_id)
+        cached = cache.get_user(user_id)
+        if cached is not None:
+            return cached
+        version = cache.version
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT user_id, wins, br_placements, events, marathon_wins FROM stats")
-            data = {}
-            for row in rows:
-                data[row['user_id']] = {
-                    "wins": row['wins'],
-                    "br_placements": row['br_placements'] or [],
-                    "events": row['events'] or [],
+            row = await conn.fetchrow_named("user_stats", guild_id, user_id)
+            if row:
+                data = {
+                    "wins": row['wins'] or 0,
+                    "br_placements": list(row['br_placements']),
+                    "event_count": row['event_count'],
+                    "recent_events": list(row['recent_events']),
                     "marathon_wins": row['marathon_wins'] or 0,
                 }
+            else:
+                data = {"wins": 0, "br_placements": [], "event_count": 0, "recent_events": [], "marathon_wins": 0}
+            cache.set_user(user_id, data, version)
             return data
 
-    async def get_user_stats(self, user_id):
+    async def get_user_history(self, guild_id, user_id, after=0, limit=25):
+        """One page of a user's full event history, oldest first, after entry id `after`."""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT wins, br_placements, events, marathon_wins FROM stats WHERE user_id=$1",
-                user_id
+            return await conn.fetch_named("user_history", guild_id, user_id, after, limit)
+
+    async def add_event_entries(self, guild_id, entries):
+        """
+        Register (uid, event_str, placement, win) tuples in a guild. With write-behind
+        enabled they are journalled and acknowledged immediately; otherwise
+        they are written straight away by write_entries.
+        """
+        ops = []
+        for uid, event_str, placement, win in entries:
+            _, event_name, event, event_date, br_placement = entry_record(uid, event_str, placement)
+            ops.append({
+                "op_id": new_op_id(), "guild_id": guild_id, "user_id": uid, "event_name": event_name, "event": event,
+                "event_date": event_date, "br_placement": br_placement, "win": 1 if win else 0,
+            })
+        if not ops:
+            return
+        if self.write_behind:
+            await self.write_behind.submit(ops)
+        else:
+            await self.write_entries(ops)
+
+    async def write_entries(self, ops):
+        """
+        Write a batch of registration ops in one statement: every event_entries
+        row is inserted and every stored win counter bumped atomically, however
+        many players are in the batch. Ops already written are skipped.
+        """
+        columns = ("guild_id", "user_id", "event_name", "event", "event_date", "br_placement", "win", "op_id")
+        guild_ids, user_ids, event_names, events, event_dates, placements, wins, op_ids = (
+            [op[column] for op in ops] for column in columns
+        )
+        keys = set(zip(guild_ids, user_ids))
+        async with self.locks(*keys), self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, guild_ids)
+            await conn.execute_named(
+                "add_event_entries", guild_ids, user_ids, event_names, events, event_dates, placements, wins, op_ids
             )
-            if row:
-                br_placements = row['br_placements'] or []
-                events = row['events'] or []
+        for guild_id, user_id in keys:
+            self.cache_for(guild_id).invalidate(user_id)
+        for guild_id, event in zip(guild_ids, events):
+            if event and guild_id in self.names:
+                self.names[guild_id].add(event)
 
-                br_wins = sum(1 for placement in br_placements if placement == "1st")
-                total_wins = len(events) + br_wins
+    async def settle(self, guild_id, *user_ids):
+        """Flush queued registrations first if any of these users have some pending."""
+        if self.write_behind and self.write_behind.has_pending(*((guild_id, uid) for uid in user_ids)):
+            await self.write_behind.flush()
 
-                return {
-                    "wins": total_wins,
-                    "br_placements": br_placements,
-                    "events": events,
-                    "marathon_wins": row['marathon_wins'] or 0,
-                }
+    async def add_event_entry(self, guild_id, uid, event_str, placement=None, win=True):
+        await self.add_event_entries(guild_id, [(uid, event_str, placement, win)])
+
+    async def resolve_players(self, ctx, args):
+        """
+        Resolve a list of member arguments in one pass. Mentions and raw ids are
+        looked up together through the bot's MemberResolver; anything else falls back to
+        MemberConverter. Duplicates and unknown members are dropped.
+        """
+        ids = []
+        names = []
+        for arg in args:
+            match = MENTION_RE.match(arg)
+            if match:
+                ids.append(match.group(1) or match.group(2))
             else:
-                return {"wins": 0, "br_placements": [], "events": [], "marathon_wins": 0}
+                names.append(arg)
+
+        members = await self.bot.members.resolve(ctx.guild, ids)
+        players = [members[uid] for uid in dict.fromkeys(ids) if members.get(uid)]
+        for name in names:
+            try:
+                players.append(await commands.MemberConverter().convert(ctx, name))
+            except commands.BadArgument:
+                continue
+        return list({p.id: p for p in players}.values())
 
+    async def search_events(self, guild_id, term, after=None, limit=8):
+        """
+        One page of a guild's event_entries whose name contains term, newest first.
+        after is the (sort_date, id) of the last row on the previous page.
+        """
+        async with self.pool.acquire() as conn:
+            return await conn.fetch_named("search_events", guild_id, *search_args(term, after), limit)
 
     @commands.command()
     async def list(self, ctx):
@@ -277,43 +441,32 @@ class EventCog(commands.Cog):
     async def eventreg(self, ctx, player: discord.Member, event_name: str, is_battle_royal: str, placement_or_date: str = None, date: str = None):
         is_br = is_battle_royal.lower() in ("true", "yes", "1", "y")
         uid = str(player.id)
-        stats = await self.get_user_stats(uid)
-        wins = stats["wins"]
-        br_placements = stats["br_placements"]
-        events = stats["events"]
-        marathon_wins = stats["marathon_wins"]
 
         if is_br:
             if placement_or_date is None or date is None:
                 await ctx.send("You must specify placement and date for a battle royal event. Example:\n!eventreg @player event_name true 1st 7/25")
                 return
             placement = placement_or_date
-            br_placements.append(placement)
-            events.append(f"{event_name} (Date: {date})")
-            if placement.lower() == "1st":
-                wins += 1
+            await self.add_event_entry(ctx.guild.id, uid, format_event(event_name, date), placement, win=placement.lower() == "1st")
             await ctx.send(f"Recorded battle royal event **{event_name}** for {player.display_name} with placement {placement} on {date}.")
         else:
             date = placement_or_date
             if date is None:
                 await ctx.send("You must specify the date for a non-battle royal event. Example:\n!eventreg @player event_name false 7/25")
                 return
-            events.append(f"{event_name} (Date: {date})")
-            wins += 1
+            await self.add_event_entry(ctx.guild.id, uid, format_event(event_name, date))
             await ctx.send(f"Recorded non-battle royal event **{event_name}** for {player.display_name} on {date}.")
 
-        await self.save_user_stats(uid, wins, br_placements, events, marathon_wins)
-
     
     @commands.command()
     async def variety(self, ctx, member: discord.Member = None):
         """Show variety breakdown for a specific user."""
         member = member or ctx.author
 
-        rows = await self.pool.fetch(
-            "SELECT events FROM stats WHERE user_id = $1",
-            str(member.id)
-        )
+        uid = str(member.id)
+        await self.settle(ctx.guild.id, uid)
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch_named("user_event_counts", ctx.guild.id, uid)
 
         if not rows:
             return await ctx.send(f"⚠️ {member.display_name} has no recorded events.")
@@ -321,9 +474,8 @@ class EventCog(commands.Cog):
         normalized_counts = {}
 
         for row in rows:
-            for raw_event in row["events"]:
-                event = normalize_event(raw_event)
-                normalized_counts[event] = normalized_counts.get(event, 0) + 1
+            event = normalize_event(row['event_name'])
+            normalized_counts[event] = normalized_counts.get(event, 0) + row['entries']
 
         total_events = sum(normalized_counts.values())
         unique_events = len(normalized_counts)
@@ -351,14 +503,17 @@ class EventCog(commands.Cog):
         member = member or ctx.author
 
         rows = await self.pool.fetch(
-            "SELECT br_placements FROM stats WHERE user_id = $1",
-            str(member.id)
+            """
+            SELECT br_placement FROM event_entries
+            WHERE guild_id = $1 AND user_id = $2 AND br_placement IS NOT NULL ORDER BY id
+            """,
+            ctx.guild.id, str(member.id)
         )
 
         if not rows:
             return await ctx.send(f"⚠️ No placements found for {member.display_name}.")
 
-        placements = [row["br_placements"] for row in rows]
+        placements = [row["br_placement"] for row in rows]
 
         await ctx.send(f"📊 Raw placements for {member.display_name}:\n```{placements}```")
 
@@ -372,48 +527,43 @@ class EventCog(commands.Cog):
         user = player or ctx.author
         uid = str(user.id)
 
-        row = await self.pool.fetchrow(
-            "SELECT wins, br_placements, events, marathon_wins FROM stats WHERE user_id = $1",
-            uid
-        )
-        if not row or not row.get("events"):
-            return await ctx.send(f"⚠️ No events found for {user.display_name}.")
-
-        events = list(row["events"] or [])
-        br_placements = list(row["br_placements"] or [])
-        wins = row.get("wins", 0) or 0
-        marathon_wins = row.get("marathon_wins", 0) or 0
-
-        matched_index = None
-        for i, e in enumerate(events):
-            if event_name.lower() in e.lower() and date in e:
-                matched_index = i
-                break
+        await self.settle(ctx.guild.id, uid)
+        async with self.locks((ctx.guild.id, uid)), self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, [ctx.guild.id])
+            removed = await conn.fetchrow(
+                """
+                WITH target AS (
+                    SELECT id FROM event_entries
+                    WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL
+                      AND strpos(lower(event_name), lower($3)) > 0
+                      AND strpos(event_name, $4) > 0
+                    ORDER BY id
+                    LIMIT 1
+                ), removed AS (
+                    DELETE FROM event_entries e USING target
+                    WHERE e.guild_id = $1 AND e.id = target.id
+                    RETURNING e.event_name, e.br_placement
+                ), updated AS (
+                    UPDATE stats SET wins = GREATEST(0, COALESCE(stats.wins, 0) - 1)
+                    FROM removed
+                    WHERE stats.guild_id = $1 AND stats.user_id = $2
+                      AND (removed.br_placement IS NULL OR lower(removed.br_placement) = '1st')
+                )
+                SELECT event_name, br_placement FROM removed
+                """,
+                ctx.guild.id, uid, event_name, date
+            )
+        self.cache_for(ctx.guild.id).invalidate(uid)
 
-        if matched_index is None:
+        if removed is None:
+            async with self.pool.acquire() as conn:
+                has_events = await conn.fetchval_named("user_has_events", ctx.guild.id, uid)
+            if not has_events:
+                return await ctx.send(f"⚠️ No events found for {user.display_name}.")
             return await ctx.send(f"⚠️ Could not find an event matching `{event_name}` on `{date}` for {user.display_name}.")
 
-        def is_br_event(text: str) -> bool:
-            t = text.lower()
-            return ("royal" in t) or ("battle" in t and "royal" in t) or ("race royal" in t)
-
-        br_event_positions = [i for i, e in enumerate(events) if is_br_event(e)]
-
-        removed_event = events.pop(matched_index)
-
-        removed_placement = None
-        if matched_index in br_event_positions:
-            br_index = br_event_positions.index(matched_index)
-            if br_index < len(br_placements):
-                removed_placement = br_placements.pop(br_index)
-
-        if removed_placement:
-            if isinstance(removed_placement, str) and removed_placement.lower() == "1st":
-                wins = max(0, wins - 1)
-        else:
-            wins = max(0, wins - 1)
-
-        await self.save_user_stats(uid, wins, br_placements, events, marathon_wins)
+        removed_event = removed["event_name"]
+        removed_placement = removed["br_placement"]
 
         msg = f"✅ Removed event for {user.display_name}: `{removed_event}`"
         if removed_placement:
@@ -423,9 +573,10 @@ class EventCog(commands.Cog):
     @commands.command()
     async def setwins(self, ctx, member: discord.Member, new_wins: int):
         """Overwrite a user's normal wins"""
+        await self.settle(ctx.guild.id, str(member.id))
         row = await self.pool.fetchrow(
-            "SELECT wins FROM stats WHERE user_id = $1",
-            member.id
+            "SELECT wins FROM stats WHERE guild_id = $1 AND user_id = $2",
+            ctx.guild.id, str(member.id)
         )
         old_wins = row["wins"] if row else 0
 
@@ -462,46 +613,63 @@ class EventCog(commands.Cog):
             if not getattr(view, "confirmed", False):
                 return
 
-        await self.pool.execute(
-            "UPDATE stats SET wins = $1 WHERE user_id = $2",
-            new_wins, member.id
-        )
+        async with self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, [ctx.guild.id])
+            await conn.execute(
+                "UPDATE stats SET wins = $3 WHERE guild_id = $1 AND user_id = $2",
+                ctx.guild.id, str(member.id), new_wins
+            )
+        self.cache_for(ctx.guild.id).invalidate(str(member.id))
         await ctx.send(f"✅ Set {member.display_name}'s wins to {new_wins}.")
 
     @commands.command()
-    async def recalc(self, ctx, member: discord.Member = None):
-        """Recalculate wins: all events minus non-1st BR placements."""
+    async def recalc(self, ctx, member: Union[discord.Member, Literal["all"]] = None):
+        """Recalculate wins: all events minus non-1st BR placements. `!recalc all` (admins) fixes every player."""
+        if member == "all":
+            if not ctx.author.guild_permissions.administrator:
+                return await ctx.send("❌ `!recalc all` requires administrator permissions.")
+            if self.write_behind:
+                await self.write_behind.flush()
+            async with self.pool.acquire() as conn:
+                changed = await recalc_wins(conn, ctx.guild.id)
+            self.cache_for(ctx.guild.id).clear()
+            return await ctx.send(f"✅ Recalculated wins for every player; **{len(changed)}** totals changed.")
+
         member = member or ctx.author
         user_id = str(member.id)
 
-        rows = await self.pool.fetch(
-            "SELECT events, br_placements FROM stats WHERE user_id = $1",
-            user_id
-        )
+        await self.settle(ctx.guild.id, user_id)
+        async with self.locks((ctx.guild.id, user_id)):
+            async with self.pool.acquire() as conn:
+                total_wins = await conn.fetchval("SELECT wins FROM stats WHERE guild_id = $1 AND user_id = $2", ctx.guild.id, user_id)
+                if total_wins is None:
+                    return await ctx.send(f"⚠️ {member.display_name} has no stats recorded.")
+                changed = await recalc_wins(conn, ctx.guild.id, user_id)
+            if changed:
+                total_wins = changed[0]['wins']
+            self.cache_for(ctx.guild.id).invalidate(user_id)
 
-        if not rows:
-            return await ctx.send(f"⚠️ {member.display_name} has no stats recorded.")
+        await ctx.send(f"✅ Recalculated wins for {member.display_name}: **{total_wins}**")
 
-        total_wins = sum(len(row['events']) if isinstance(row['events'], list) else 1 for row in rows)
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def audit(self, ctx):
+        """Check every player's stored totals against their event history in the background."""
+        task = self.audits.get(ctx.guild.id)
+        if task and not task.done():
+            return await ctx.send("⏳ An audit of this server is already running.")
+
+        async def run():
+            try:
+                report = await audit_stats(self.pool, ctx.guild.id)
+            except Exception as e:
+                self.bot.logger.exception("Stats audit failed")
+                return await ctx.send(f"❌ Audit failed: {e}")
+            hint = "\nRun `!recalc all` to fix stored wins." if report.flagged["wins"] else ""
+            await ctx.send(f"🔎 {report.summary()}{hint}"[:2000])
 
-        for row in rows:
-            br_array = row.get('br_placements') or []
-            for placement in br_array:
-                match = re.search(r'\d+', placement)
-                if match:
-                    number = int(match.group())
-                    if number != 1:
-                        total_wins -= 1
-
-        if total_wins < 0:
-            total_wins = 0
-
-        await self.pool.execute(
-            "UPDATE stats SET wins = $1 WHERE user_id = $2",
-            total_wins, user_id
-        )
-
-        await ctx.send(f"✅ Recalculated wins for {member.display_name}: **{total_wins}**")
+        self.audits[ctx.guild.id] = asyncio.create_task(run())
+        await ctx.send("🔎 Audit started; the summary will be posted here when it finishes.")
 
     @commands.command()
     async def editreg(self, ctx, player: discord.Member, *, args: str):
@@ -512,166 +680,220 @@ class EventCog(commands.Cog):
             return
 
         old_event_str, new_event_str = map(str.strip, args.split("=>", 1))
-        stats = await self.get_user_stats(uid)
-        events = stats["events"]
+        await self.settle(ctx.guild.id, uid)
+        async with self.locks((ctx.guild.id, uid)):
+            rows = await self.pool.fetch(
+                """
+                SELECT id, event_name FROM event_entries
+                WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL ORDER BY id
+                """,
+                ctx.guild.id, uid
+            )
+            events = [row["event_name"] for row in rows]
 
-        date_pattern = r"\(?Date:\s*(\d{1,2})/(\d{1,2})/(\d{4})\)?"
+            date_pattern = r"\(?Date:\s*(\d{1,2})/(\d{1,2})/(\d{4})\)?"
 
-        def normalize_event(e):
-            return re.sub(r"\(Date:\s*", "(", e).replace(")", "").strip()
+            def normalize_event(e):
+                return re.sub(r"\(Date:\s*", "(", e).replace(")", "").strip()
 
-        normalized_old = normalize_event(old_event_str)
+            normalized_old = normalize_event(old_event_str)
 
-        index = None
-        if old_event_str in events:
-            index = events.index(old_event_str)
-        else:
-            for i, e in enumerate(events):
-                if normalize_event(e) == normalized_old:
-                    index = i
-                    break
+            index = None
+            if old_event_str in events:
+                index = events.index(old_event_str)
+            else:
+                for i, e in enumerate(events):
+                    if normalize_event(e) == normalized_old:
+                        index = i
+                        break
 
-        if index is None:
-            await ctx.send(f"Could not find the event {old_event_str} in {player.display_name}'s events.")
-            return
+            if index is None:
+                await ctx.send(f"Could not find the event {old_event_str} in {player.display_name}'s events.")
+                return
 
-        events[index] = new_event_str
-        await self.save_user_stats(uid, stats["wins"], stats["br_placements"], events, stats["marathon_wins"])
+            _, event_name, event, event_date, _ = entry_record(uid, new_event_str)
+            async with self.pool.acquire() as conn, conn.transaction():
+                await lock_guild_writes(conn, [ctx.guild.id])
+                await conn.execute(
+                    "UPDATE event_entries SET event_name = $3, event = $4, event_date = $5 WHERE guild_id = $1 AND id = $2",
+                    ctx.guild.id, rows[index]["id"], event_name, event, event_date
+                )
+            self.cache_for(ctx.guild.id).invalidate(uid)
         await ctx.send(f"Updated event for {player.display_name}:\n{old_event_str} → {new_event_str}")
 
 
     @commands.command()
     async def marathonset(self, ctx, player: discord.Member, count: int):
         uid = str(player.id)
-        stats = await self.get_user_stats(uid)
         marathon_wins = count
-        await self.save_user_stats(uid, stats['wins'], stats['br_placements'], stats['events'], marathon_wins)
+        async with self.locks((ctx.guild.id, uid)):
+            await self.pool.execute(
+                """
+                INSERT INTO stats (guild_id, user_id, wins, marathon_wins)
+                VALUES ($1, $2, 0, $3)
+                ON CONFLICT (guild_id, user_id) DO UPDATE
+                SET marathon_wins = EXCLUDED.marathon_wins
+                """,
+                ctx.guild.id, uid, marathon_wins
+            )
+            self.cache_for(ctx.guild.id).invalidate(uid)
         await ctx.send(f"Set Marathon Wins for {player.display_name} to {marathon_wins}.")
 
     @commands.command()
     async def allevents(self, ctx, player: discord.Member):
         uid = str(player.id)
-        data = await self.get_user_stats(uid)
+        data = await self.get_user_stats(ctx.guild.id, uid)
 
-        if not data or not data["events"]:
+        if not data["event_count"]:
             await ctx.send(f"No events found for {player.display_name}.")
             return
 
-        events_list = data["events"]
-        display_events = ""
-        for e in events_list:
-            display_events += f"• {e}\n"
+        get_history = self.get_user_history
+        per_page = 25
+        max_page = (data["event_count"] - 1) // per_page + 1
 
-        embed = discord.Embed(
-            title=f"All Events for {player.display_name}",
-            description=display_events,
-            color=discord.Color.dark_teal()
-        )
-        await ctx.send(embed=embed)
+        class HistoryView(ui.View):
+            # Pages are fetched from event_entries by id as the user flips
+            # through them; only the pages actually viewed are read.
+            def __init__(self):
+                super().__init__(timeout=180)
+                self.page = 1
+                self.cursors = [0]
+                self.prev_button.disabled = True
+                self.next_button.disabled = max_page <= 1
+
+            async def update_embed(self):
+                rows = await get_history(ctx.guild.id, uid, self.cursors[self.page - 1], per_page + 1)
+                page_rows = rows[:per_page]
+                has_next = len(rows) > per_page
+                if has_next and len(self.cursors) == self.page:
+                    self.cursors.append(page_rows[-1]['id'])
+                self.next_button.disabled = not has_next
+                return discord.Embed(
+                    title=f"All Events for {player.display_name} (Page {self.page}/{max(max_page, self.page)})",
+                    description="".join(f"• {row['event_name']}\n" for row in page_rows),
+                    color=discord.Color.dark_teal()
+                )
+
+            @ui.button(label="Previous", style=discord.ButtonStyle.blurple)
+            async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+                if self.page > 1:
+                    self.page -= 1
+                    self.prev_button.disabled = self.page == 1
+                    embed = await self.update_embed()
+                    await interaction.response.edit_message(embed=embed, view=self)
+
+            @ui.button(label="Next", style=discord.ButtonStyle.blurple)
+            async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+                if self.page < len(self.cursors):
+                    self.page += 1
+                    self.prev_button.disabled = False
+                    embed = await self.update_embed()
+                    await interaction.response.edit_message(embed=embed, view=self)
+
+        view = HistoryView()
+        embed = await view.update_embed()
+        await ctx.send(embed=embed, view=view)
 
     @commands.command()
     async def stats(self, ctx, player: discord.Member = None):
         team_cog = self.bot.get_cog("TeamCog")
 
         if player is None:
-            stats = await self.get_stats()
-            if not stats:
+            standings = self.bot.get_cog("StandingsCog")
+            snapshot = await standings.snapshot(ctx.guild.id)
+            if not snapshot.players:
                 await ctx.send("No stats found yet.")
                 return
 
-            sorted_users = sorted(
-                stats.items(),
-                key=lambda item: (-item[1].get("wins", 0), -len(item[1].get("br_placements", [])))
-            )
+            resolver = self.bot.members
+            renders = self.bot.renders
             per_page = 8
-            max_page = (len(sorted_users) - 1) // per_page + 1
 
             class StatsLeaderboardView(ui.View):
-                def __init__(self):
+                # Only the page number is kept; each page is read from the
+                # guild's current snapshot, so an open view doesn't keep an
+                # old snapshot alive after the cog has replaced or evicted it.
+                def __init__(self, max_page):
                     super().__init__(timeout=180)
                     self.page = 1
-                    self.prev_button.disabled = True
-                    if max_page <= 1:
-                        self.next_button.disabled = True
+                    self.max_page = max_page
+                    self.update_buttons()
+
+                def update_buttons(self):
+                    self.prev_button.disabled = self.page <= 1
+                    self.next_button.disabled = self.page >= self.max_page
 
                 async def update_embed(self):
-                    start = (self.page - 1) * per_page
-                    end = start + per_page
-                    page_users = sorted_users[start:end]
+                    current = await standings.snapshot(ctx.guild.id)
+                    self.max_page = current.pages(per_page)
+                    self.page = min(self.page, self.max_page)
+                    self.update_buttons()
+                    return await renders.render(
+                        "stats", ctx.guild.id, current.built_at, self.page,
+                        lambda: self.build_embed(current.page(self.page, per_page), self.page, self.max_page)
+                    )
+
+                async def build_embed(self, page_users, page, max_page):
                     embed = discord.Embed(
-                        title=f"🏆 Top Players by Wins (Page {self.page}/{max_page})",
+                        title=f"🏆 Top Players by Wins (Page {page}/{max_page})",
                         description="",
                         color=discord.Color.dark_teal()
                     )
-                    for idx, (uid, data) in enumerate(page_users, start=start + 1):
-                        member = ctx.guild.get_member(int(uid))
-                        if not member:
-                            try:
-                                member = await ctx.guild.fetch_member(int(uid))
-                            except:
-                                member = None
+                    members = await resolver.resolve(ctx.guild, [row['user_id'] for row in page_users])
+                    for row in page_users:
+                        uid = row['user_id']
+                        member = members.get(uid)
                         mention = member.mention if member else f"<@{uid}>"
                         team_display = ""
-                        if team_cog:
-                            team_id = await team_cog.get_user_team(uid)
-                            if team_id is not None:
-                                team_name = await team_cog.get_team_name_by_id(team_id)
-                                if team_name:
-                                    emoji = team_cog.TEAM_EMOJIS.get(team_name)
-                                    if emoji:
-                                        team_display = f"{emoji} {team_name} | "
-                        wins = data.get("wins", 0)
-                        br_placements = ", ".join(data.get("br_placements", [])) if data.get("br_placements") else "None"
-                        embed.description += f"**{idx}. {team_display}{mention}** — Wins: {wins}, BR Placements: {br_placements}\n\n"
+                        if row['team'] and row['team_emoji']:
+                            team_display = f"{row['team_emoji']} {row['team']} | "
+                        wins = row['wins']
+                        br_placements = ", ".join(row['br_placements']) if row['br_placements'] else "None"
+                        embed.description += f"**{row['rank']}. {team_display}{mention}** — Wins: {wins}, BR Placements: {br_placements}\n\n"
                     return embed
 
                 @ui.button(label="Previous", style=discord.ButtonStyle.blurple)
                 async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
                     if self.page > 1:
                         self.page -= 1
-                        self.prev_button.disabled = self.page == 1
-                        self.next_button.disabled = False
                         embed = await self.update_embed()
                         await interaction.response.edit_message(embed=embed, view=self)
 
                 @ui.button(label="Next", style=discord.ButtonStyle.blurple)
                 async def next_button(self, interaction: discord.Interaction, button: ui.Button):
-                    if self.page < max_page:
+                    if self.page < self.max_page:
                         self.page += 1
-                        self.next_button.disabled = self.page == max_page
-                        self.prev_button.disabled = False
                         embed = await self.update_embed()
                         await interaction.response.edit_message(embed=embed, view=self)
 
-            view = StatsLeaderboardView()
+            view = StatsLeaderboardView(snapshot.pages(per_page))
             embed = await view.update_embed()
             await ctx.send(embed=embed, view=view)
 
         else:
             uid = str(player.id)
-            data = await self.get_user_stats(uid)
-            if not data or (data["wins"] == 0 and not data["br_placements"] and not data["events"] and data["marathon_wins"] == 0):
+            data = await self.get_user_stats(ctx.guild.id, uid)
+            if not data or (data["wins"] == 0 and not data["br_placements"] and not data["event_count"] and data["marathon_wins"] == 0):
                 await ctx.send(f"No stats found for {player.display_name}.")
                 return
 
             team_display = ""
             if team_cog:
-                team_id = await team_cog.get_user_team(uid)
+                team_id = await team_cog.get_user_team(ctx.guild.id, uid)
                 if team_id is not None:
-                    team_name = await team_cog.get_team_name_by_id(team_id)
+                    team_name = await team_cog.get_team_name_by_id(ctx.guild.id, team_id)
                     if team_name:
-                        emoji = team_cog.TEAM_EMOJIS.get(team_name.lower())
+                        emoji = await team_cog.get_emoji_for_team(ctx.guild.id, team_name)
                         if emoji:
                             team_display = f"{emoji} {team_name} "
 
             placements = ", ".join(data["br_placements"]) if data["br_placements"] else "None"
-            events_list = data["events"] if data["events"] else []
             marathon_wins = data["marathon_wins"]
 
-            max_events_display = 10
-            events_to_show = events_list[-max_events_display:][::-1]
+            events_to_show = data["recent_events"][::-1]
             display_events = "\n".join(f"• {e}" for e in events_to_show)
-            remaining = len(events_list) - max_events_display
+            remaining = data["event_count"] - len(events_to_show)
             if remaining > 0:
                 display_events += f"\n+{remaining} more..."
 
@@ -693,52 +915,39 @@ class EventCog(commands.Cog):
         if source.id == target.id:
             return await ctx.send("❌ You can’t clone stats onto the same user.")
 
-        source_totals = await self.pool.fetchrow(
-            "SELECT br_placements, events, marathon_wins FROM stats WHERE user_id = $1",
-            str(source.id)
-        )
-
-        if not source_totals:
-            return await ctx.send(f"⚠️ {source.display_name} has no stats to clone.")
-
-        target_totals = await self.pool.fetchrow(
-            "SELECT br_placements, events, marathon_wins FROM stats WHERE user_id = $1",
-            str(target.id)
-        )
-
-        if target_totals:
-            new_br = target_totals["br_placements"] + source_totals["br_placements"]
-            new_marathon = target_totals["marathon_wins"] + source_totals["marathon_wins"]
-            new_events = target_totals["events"] + source_totals["events"]
-            await self.pool.execute(
-                "UPDATE stats SET br_placements = $1, events = $2, marathon_wins = $3 WHERE user_id = $4",
-                new_br, new_events, new_marathon, str(target.id)
-            )
-        else:
-            await self.pool.execute(
-                "INSERT INTO stats (user_id, br_placements, events, marathon_wins) VALUES ($1, $2, $3, $4)",
-                str(target.id), source_totals["br_placements"], source_totals["events"], source_totals["marathon_wins"]
-            )    
-    
-        event_rows = await self.pool.fetch(
-            "SELECT br_placements, events, marathon_wins FROM stats WHERE user_id = $1",
-            str(source.id)
-        )
+        await self.settle(ctx.guild.id, str(source.id), str(target.id))
+        async with self.locks((ctx.guild.id, str(source.id)), (ctx.guild.id, str(target.id))):
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await lock_guild_writes(conn, [ctx.guild.id])
+                    source_totals = await conn.fetchrow(
+                        "SELECT marathon_wins FROM stats WHERE guild_id = $1 AND user_id = $2",
+                        ctx.guild.id, str(source.id)
+                    )
 
-        cloned_count = 0
-        for row in event_rows:
-            try:
-                await self.pool.execute(
-                    """
-                    INSERT INTO stats (user_id, br_placements, events, marathon_wins)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT DO NOTHING
-                    """,
-                    str(target.id), row["br_placements"], row["events"], row["marathon_wins"]
-                )
-                cloned_count += 1
-            except:
-                continue
+                    if not source_totals:
+                        return await ctx.send(f"⚠️ {source.display_name} has no stats to clone.")
+
+                    await conn.execute(
+                        """
+                        INSERT INTO stats (guild_id, user_id, marathon_wins)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (guild_id, user_id) DO UPDATE
+                        SET marathon_wins = COALESCE(stats.marathon_wins, 0) + EXCLUDED.marathon_wins
+                        """,
+                        ctx.guild.id, str(target.id), source_totals["marathon_wins"] or 0
+                    )
+                    status = await conn.execute(
+                        """
+                        INSERT INTO event_entries (guild_id, user_id, event_name, event, event_date, br_placement)
+                        SELECT guild_id, $3, event_name, event, event_date, br_placement
+                        FROM event_entries WHERE guild_id = $1 AND user_id = $2
+                        ORDER BY id
+                        """,
+                        ctx.guild.id, str(source.id), str(target.id)
+                    )
+                    cloned_count = int(status.split()[-1])
+            self.cache_for(ctx.guild.id).invalidate(str(target.id))
 
         await ctx.send(
             f"✅ Cloned **{cloned_count}** event entries and updated totals (BR placements, events, marathon wins) from {source.display_name} → {target.display_name}."
@@ -748,8 +957,14 @@ class EventCog(commands.Cog):
     @commands.command()
     async def clearall(self, ctx, player: discord.Member):
         uid = str(player.id)
-        async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM stats WHERE user_id=$1", uid)
+        await self.settle(ctx.guild.id, uid)
+        async with self.locks((ctx.guild.id, uid)):
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await lock_guild_writes(conn, [ctx.guild.id])
+                    await conn.execute("DELETE FROM event_entries WHERE guild_id=$1 AND user_id=$2", ctx.guild.id, uid)
+                    await conn.execute("DELETE FROM stats WHERE guild_id=$1 AND user_id=$2", ctx.guild.id, uid)
+            self.cache_for(ctx.guild.id).invalidate(uid)
         await ctx.send(f"All stats cleared for {player.display_name}.")
 
     @commands.command()
@@ -760,13 +975,7 @@ class EventCog(commands.Cog):
 
         date = args[-1]
         event_name = args[-2]
-        players = []
-        for mention in args[:-2]:
-            try:
-                member = await commands.MemberConverter().convert(ctx, mention)
-                players.append(member)
-            except:
-                continue
+        players = await self.resolve_players(ctx, args[:-2])
 
         if len(players) == 0:
             await ctx.send(f"Registered **{event_name}** for Casper the Ghost on {date}. SPECIFY USERS DUMBASS :sob:")
@@ -775,18 +984,8 @@ class EventCog(commands.Cog):
             await ctx.send("Please use !eventreg for single wins.")
             return
 
-        event_entry = f"{event_name} (Date: {date})"
-        for player in players:
-            uid = str(player.id)
-            stats = await self.get_user_stats(uid)
-            wins = stats["wins"]
-            br_placements = stats["br_placements"]
-            events = stats["events"]
-            marathon_wins = stats["marathon_wins"]
-
-            events.append(event_entry)
-            wins += 1
-            await self.save_user_stats(uid, wins, br_placements, events, marathon_wins)
+        event_entry = format_event(event_name, date)
+        await self.add_event_entries(ctx.guild.id, [(str(player.id), event_entry, None, True) for player in players])
 
         mentions_text = "\n• ".join(p.mention for p in players)
         await ctx.send(f"Recorded **{event_name}** for the following users on {date}:\n• {mentions_text}")
@@ -795,22 +994,36 @@ class EventCog(commands.Cog):
     @commands.command()
     async def clearrec(self, ctx, player: discord.Member):
         uid = str(player.id)
-        stats = await self.get_user_stats(uid)
-        if not stats or (stats["wins"] == 0 and not stats["br_placements"] and not stats["events"]):
+        await self.settle(ctx.guild.id, uid)
+        async with self.locks((ctx.guild.id, uid)), self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, [ctx.guild.id])
+            removed = await conn.fetchrow(
+                """
+                WITH target AS (
+                    SELECT id FROM event_entries WHERE guild_id = $1 AND user_id = $2
+                    ORDER BY id DESC
+                    LIMIT 1
+                ), removed AS (
+                    DELETE FROM event_entries e USING target
+                    WHERE e.guild_id = $1 AND e.id = target.id
+                    RETURNING e.event_name, e.br_placement
+                ), updated AS (
+                    UPDATE stats SET wins = GREATEST(0, COALESCE(stats.wins, 0) - 1)
+                    FROM removed
+                    WHERE stats.guild_id = $1 AND stats.user_id = $2 AND lower(removed.br_placement) = '1st'
+                )
+                SELECT event_name, br_placement FROM removed
+                """,
+                ctx.guild.id, uid
+            )
+        self.cache_for(ctx.guild.id).invalidate(uid)
+        if removed is None:
             await ctx.send(f"No stats found for {player.display_name}.")
             return
 
-        br_placements = stats["br_placements"]
-        events = stats["events"]
-        wins = stats["wins"]
-        marathon_wins = stats["marathon_wins"]
-
-        removed_event = events.pop() if events else None
-        removed_placement = br_placements.pop() if br_placements else None
-        if removed_placement and removed_placement.lower() == "1st":
-            wins = max(0, wins - 1)
+        removed_event = removed["event_name"]
+        removed_placement = removed["br_placement"]
 
-        await self.save_user_stats(uid, wins, br_placements, events, marathon_wins)
         await ctx.send(
             f"Removed most recent event for {player.display_name}: "
             f"event: {removed_event or 'N/A'}, placement: {removed_placement or 'N/A'}."
@@ -821,6 +1034,10 @@ class EventCog(commands.Cog):
         
         categories = list(GAME_DATA.keys())
         page = 0
+        renders = self.bot.renders
+
+        async def page_embed(page_index):
+            return await renders.render("index", None, None, page_index, lambda: make_embed(page_index))
 
         def make_embed(page_index):
             cat = categories[page_index]
@@ -833,7 +1050,7 @@ class EventCog(commands.Cog):
             embed.set_footer(text=f"Page {page_index + 1}/{len(categories)}")
             return embed
 
-        message = await ctx.send(embed=make_embed(page))
+        message = await ctx.send(embed=await page_embed(page))
 
         class IndexView(discord.ui.View):
             def __init__(self, ctx, message):
@@ -843,7 +1060,7 @@ class EventCog(commands.Cog):
                 self.page = 0
 
             async def update_embed(self, interaction=None):
-                embed = make_embed(self.page)
+                embed = await page_embed(self.page)
                 if interaction:
                     await interaction.response.edit_message(embed=embed, view=self)
                 else:
@@ -882,98 +1099,102 @@ class EventCog(commands.Cog):
 
     @commands.command()
     async def search(self, ctx, *, game_name: str):
-        game_name_lower = game_name.lower()
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT user_id, events FROM stats")
-
-        matched_entries = []
-        for row in rows:
-            user_id = row['user_id']
-            events = row['events'] or []
-            for event_str in events:
-                if game_name_lower in event_str.lower():
-                    event_date = parse_event_date(event_str)
-                    matched_entries.append((user_id, event_str, event_date))
-
-        if not matched_entries:
-            await ctx.send(f"No wins found for event matching '{game_name}'.")
-            return
-
-        matched_entries.sort(key=lambda x: x[2] or datetime.min, reverse=True)
-
+        game_name = GAME_INDEX.search_term(game_name)
+        search_events = self.search_events
+        resolver = self.bot.members
+        renders = self.bot.renders
         per_page = 8
-        max_page = (len(matched_entries) - 1) // per_page + 1
 
         class SearchView(ui.View):
             def __init__(self):
                 super().__init__(timeout=180)
                 self.page = 1
                 self.per_page = per_page
-                self.max_page = max_page
-                self.user_cache = {}
+                self.cursors = [None]
+                self.empty = False
                 self.prev_button.disabled = True
-                if self.max_page <= 1:
-                    self.next_button.disabled = True
 
             async def update_embed(self):
-                start = (self.page - 1) * self.per_page
-                end = start + self.per_page
-                page_entries = matched_entries[start:end]
+                cursor = self.cursors[self.page - 1]
+                embed, next_cursor = await renders.render(
+                    "search", ctx.guild.id, (game_name, cursor), self.page,
+                    lambda: self.build_embed(cursor)
+                )
+                if next_cursor and len(self.cursors) == self.page:
+                    self.cursors.append(next_cursor)
+                self.next_button.disabled = next_cursor is None
+                self.empty = embed is None
+                return embed
+
+            async def build_embed(self, cursor):
+                rows = await search_events(ctx.guild.id, game_name, cursor, self.per_page + 1)
+                page_entries = rows[:self.per_page]
+                if not page_entries:
+                    return None, None
+                next_cursor = None
+                if len(rows) > self.per_page:
+                    last = page_entries[-1]
+                    next_cursor = (last['sort_date'], last['id'])
 
+                start = (self.page - 1) * self.per_page
                 embed = discord.Embed(
-                    title=f"Search Results for '{game_name}' (Page {self.page}/{self.max_page})",
+                    title=f"Search Results for '{game_name}' (Page {self.page})",
                     description="",
                     color=discord.Color.dark_teal()
                 )
-                for idx, (uid, ev_str, _) in enumerate(page_entries, start=start + 1):
-                    if uid in self.user_cache:
-                        member = self.user_cache[uid]
-                    else:
-                        member = ctx.guild.get_member(int(uid))
-                        if not member:
-                            try:
-                                member = await ctx.guild.fetch_member(int(uid))
-                            except:
-                                member = None
-                        self.user_cache[uid] = member
+                members = await resolver.resolve(ctx.guild, [row['user_id'] for row in page_entries])
+                for idx, row in enumerate(page_entries, start=start + 1):
+                    uid = row['user_id']
+                    member = members.get(uid)
                     mention = member.mention if member else f"<@{uid}>"
-                    embed.description += f"**{idx}. {mention}** — {ev_str}\n"
-                return embed
+                    embed.description += f"**{idx}. {mention}** — {row['event_name']}\n"
+                return embed, next_cursor
 
             @ui.button(label="Previous", style=discord.ButtonStyle.blurple)
             async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
                 if self.page > 1:
                     self.page -= 1
                     self.prev_button.disabled = self.page == 1
-                    self.next_button.disabled = False
                     embed = await self.update_embed()
                     await interaction.response.edit_message(embed=embed, view=self)
 
             @ui.button(label="Next", style=discord.ButtonStyle.blurple)
             async def next_button(self, interaction: discord.Interaction, button: ui.Button):
-                if self.page < self.max_page:
+                if self.page < len(self.cursors):
                     self.page += 1
-                    self.next_button.disabled = self.page == self.max_page
                     self.prev_button.disabled = False
                     embed = await self.update_embed()
                     await interaction.response.edit_message(embed=embed, view=self)
 
         view = SearchView()
         embed = await view.update_embed()
+        if view.empty:
+            await ctx.send(f"No wins found for event matching '{game_name}'.")
+            return
         await ctx.send(embed=embed, view=view)
 
-class DiscordBot(commands.Bot):
-    def __init__(self, pool):
+class DiscordBot(commands.AutoShardedBot):
+    def __init__(self, pool, changes=None):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
         super().__init__(command_prefix="!", intents=intents, help_command=None)
         self.logger = logging.getLogger(__name__)
-        self.pool = pool
+        self.perf = PerfRecorder()
+        self.members = MemberResolver(self.perf)
+        self.renders = RenderCache()
+        self.pool = InstrumentedPool(pool, self.perf)
+        self.changes = changes
+        self.before_invoke(self.perf.before_invoke)
+        self.after_invoke(self.perf.after_invoke)
 
     async def setup_hook(self):
+        if self.changes:
+            self.changes.subscribe(lambda change: self.renders.bump(change.guild_id))
+        self.perf.instrument_http(self.http)
         await self.add_cog(EventCog(self, self.pool))
         await self.add_cog(TeamCog(self, self.pool))
+        await self.add_cog(StandingsCog(self))
         self.logger.info("Cogs loaded.")
 
     async def on_ready(self):
@@ -994,6 +1215,12 @@ class DiscordBot(commands.Bot):
             self.logger.error(f"Error in command {ctx.command}: {error}")
             await ctx.send(f"Error: {error}")
 
+    async def on_member_join(self, member):
+        self.members.forget(member.guild.id, member.id)
+
+    async def on_member_remove(self, member):
+        self.members.forget(member.guild.id, member.id)
+
     async def on_message(self, message):
         if message.author.bot:
             return
@@ -1011,10 +1238,22 @@ async def main():
         print("Error: DATABASE_URL not set.")
         return
 
-    pool = await asyncpg.create_pool(DATABASE_URL)
-    bot = DiscordBot(pool)
-
-    extensions = ["secret", "slash_commands"]
+    # Migrate on a standalone connection first: pooled connections prepare
+    # the query registry as they open, which needs the final schema.
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        version = await migrate(conn, home_guild_id=int(os.getenv("HOME_GUILD_ID", "0")))
+        print(f"Database schema at version {version}.")
+        for description in await check_query_plans(conn):
+            logging.warning(f"Hot query '{description}' has no usable index and falls back to a sequential scan.")
+    finally:
+        await conn.close()
+    pool = await create_pool(DATABASE_URL)
+    changes = ChangeListener(DATABASE_URL)
+    await changes.start()
+    bot = DiscordBot(pool, changes)
+
+    extensions = ["secret", "slash_commands", "perf"]
     for ext in extensions:
         try:
             await bot.load_extension(ext)
@@ -0,0 +1,61 @@
+import re
+from datetime import datetime
+
+EVENT_ALIASES = {
+    "Pizzeria Survival": ["Pizzeria Survival Hard", "Pizzeria Survival Normal", "Pizzeria Survival Easy", "Twisted Pizzeria"],
+    "Locate the Spy": ["Locate the Spy", "LtS Doubles", "LtS Legacy"],
+    "Battle Royal": ["Battle Royal", "Mini-Royal", "Co-operative Royal", "Prize Battle Royal $10"] 
+}
+
+def parse_event_date(event_str):
+    match = re.search(r"\(Date:\s*(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\)", event_str)
+    if match:
+        month = int(match.group(1))
+        day = int(match.group(2))
+        year = int(match.group(3)) if match.group(3) else datetime.now().year
+        return datetime(year, month, day)
+    else:
+        return datetime.min
+
+def normalize_event(raw_event: str) -> str:
+    """Normalize event name, merge aliases, and strip date info."""
+    event = raw_event.split("(Date:")[0].split("(")[0].strip()
+    for main_event, variants in EVENT_ALIASES.items():
+        if event in variants:
+            return main_event
+    return event
+
+def is_br_event(text: str) -> bool:
+    t = text.lower()
+    return ("royal" in t) or ("battle" in t and "royal" in t) or ("race royal" in t)
+
+def format_event(event_name: str, date: str) -> str:
+    return f"{event_name} (Date: {date})"
+
+def entry_record(user_id: str, event_str, br_placement=None):
+    """Build an event_entries row (user_id, event_name, event, event_date, br_placement)."""
+    if event_str is None:
+        return (user_id, None, None, None, br_placement)
+    try:
+        parsed = parse_event_date(event_str)
+    except ValueError:
+        parsed = datetime.min
+    event_date = parsed.date() if parsed != datetime.min else None
+    return (user_id, event_str, normalize_event(event_str), event_date, br_placement)
+
+def entry_records(user_id: str, events, br_placements):
+    """
+    Convert the legacy events/br_placements arrays into event_entries rows.
+    Placements are paired with battle royal events in order, the same way
+    regremove matched them. Placements left over get a row of their own so
+    nothing is dropped.
+    """
+    events = list(events or [])
+    placements = list(br_placements or [])
+    br_positions = [i for i, e in enumerate(events) if is_br_event(e)]
+    paired = dict(zip(br_positions, placements))
+
+    records = [entry_record(user_id, e, paired.get(i)) for i, e in enumerate(events)]
+    for placement in placements[len(paired):]:
+        records.append(entry_record(user_id, None, placement))
+    return records
@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+def normalize_name(text: str) -> str:
+    """Lowercase, spell out '&'/'n' as 'and' and drop punctuation: "Hide n' Seek" -> "hide and seek"."""
+    text = text.lower().replace("&", " and ")
+    text = re.sub(r"[^a-z0-9$]+", " ", text)
+    text = re.sub(r"\bn\b", "and", text)
+    return " ".join(text.split())
+
+def trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class GameMatch:
+    __slots__ = ("score", "name", "category", "key")
+
+    def __init__(self, score, name, category, key):
+        self.score = score
+        self.name = name
+        self.category = category
+        self.key = key
+
+    def __repr__(self):
+        return f"GameMatch({self.name!r}, {self.score:.2f})"
+
+class GameIndex:
+    """
+    Lookup table over GAME_DATA names and EVENT_ALIASES variants, built once.
+    Exact matches on the normalized name are a dict hit; anything else is
+    narrowed through a trigram inverted index and ranked by similarity, so
+    a lookup only ever scores a handful of candidates.
+    """
+
+    def __init__(self, game_data, aliases=None, cutoff=0.6):
+        self.cutoff = cutoff
+        self.entries = {}
+        self.grams = defaultdict(set)
+        self.gram_counts = {}
+        self.fragments = set()
+        self.matchers = {}
+        for category, games in game_data.items():
+            for key in games:
+                self._add(key.title(), category, key)
+        for main_event, variants in (aliases or {}).items():
+            target = self.entries.get(normalize_name(main_event), (None, None, None))
+            for name in [main_event, *variants]:
+                self._add(name, target[1], target[2])
+
+    def _add(self, name, category, key):
+        normalized = normalize_name(name)
+        if normalized in self.entries:
+            return
+        self.entries[normalized] = (name, category, key)
+        grams = trigrams(normalized)
+        self.gram_counts[normalized] = len(grams)
+        # SequenceMatcher indexes its second sequence up front; keep one per name.
+        self.matchers[normalized] = SequenceMatcher(None, "", normalized, autojunk=False)
+        for gram in grams:
+            self.grams[gram].add(normalized)
+        # Terms shorter than a trigram are checked against these instead.
+        for size in (1, 2):
+            self.fragments.update(normalized[i:i + size] for i in range(len(normalized) - size + 1))
+
+    def lookup(self, text, limit=5):
+        """Ranked GameMatch candidates for text, best first; an exact match scores 1.0."""
+        normalized = normalize_name(text)
+        if not normalized:
+            return []
+        if normalized in self.entries:
+            return [GameMatch(1.0, *self.entries[normalized])]
+
+        return list(self._rank(normalized, limit))
+
+    @lru_cache(maxsize=1024)
+    def _rank(self, normalized, limit):
+        # Dice overlap on trigrams picks the shortlist; the edit-similarity
+        # ratio then ranks it.
+        query = trigrams(normalized)
+        shared = Counter()
+        for gram in query:
+            shared.update(self.grams.get(gram, ()))
+        dice = {
+            candidate: 2 * count / (len(query) + self.gram_counts[candidate])
+            for candidate, count in shared.items()
+        }
+        shortlist = sorted(dice, key=dice.get, reverse=True)[:limit * 2]
+        matches = []
+        for candidate in shortlist:
+            matcher = self.matchers[candidate]
+            matcher.set_seq1(normalized)
+            matches.append(GameMatch(max(dice[candidate], matcher.ratio()), *self.entries[candidate]))
+        matches.sort(key=lambda m: -m.score)
+        return tuple(matches[:limit])
+
+    def best(self, text):
+        """The best match scoring at least the cutoff, or None."""
+        matches = self.lookup(text, limit=1)
+        if matches and matches[0].score >= self.cutoff:
+            return matches[0]
+        return None
+
+    def search_term(self, text):
+        """
+        The name to search event history with. Typos and spelling variants are
+        replaced by the indexed name; a term that is already part of a known
+        name (e.g. "cook") is left alone so partial searches still widen.
+        """
+        normalized = normalize_name(text)
+        if self._is_part_of_name(normalized):
+            match = self.entries.get(normalized)
+            return match[0] if match else text
+        match = self.best(text)
+        return match.name if match else text
+
+    def _is_part_of_name(self, normalized):
+        """Whether normalized occurs inside any indexed name, checked only against
+        the names sharing its rarest trigram."""
+        if len(normalized) < 3:
+            return normalized in self.fragments
+        grams = (normalized[i:i + 3] for i in range(len(normalized) - 2))
+        candidates = min((self.grams.get(gram, ()) for gram in grams), key=len)
+        return any(normalized in name for name in candidates)
@@ -0,0 +1,45 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key (a user id), created on demand. Locks are held
+    weakly, so a key's lock disappears once nobody holds or waits on it.
+
+    Multi-key callers take their locks in sorted order, so two commands that
+    touch overlapping sets of users can never deadlock. Commands for
+    unrelated users never wait on each other.
+    """
+
+    def __init__(self, perf=None):
+        self._locks = weakref.WeakValueDictionary()
+        self.perf = perf
+
+    def _lock_for(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def __call__(self, *keys):
+        # Strong references for the duration of the block keep the locks alive.
+        locks = [self._lock_for(key) for key in sorted(set(keys))]
+        acquired = []
+        started = time.perf_counter()
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired.append(lock)
+            if self.perf is not None:
+                self.perf.record_lock_wait(time.perf_counter() - started)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import OrderedDict
+import discord
+
+QUERY_LIMIT = 100
+
+class MemberResolver:
+    """
+    Bot-wide user id -> guild member lookups.
+
+    Members in the guild's own cache come straight from it. Everything else is
+    remembered for ttl seconds, and ids that resolved to nobody (users who
+    left) for negative_ttl, so a leaderboard full of departed players only
+    asks the gateway once. All misses of one resolve() call go out together
+    as gateway member requests of up to 100 ids, sent concurrently, and
+    concurrent calls asking for the same id share one request.
+    """
+
+    def __init__(self, perf=None, ttl=600, negative_ttl=300, max_entries=20000, timeout=2.0):
+        self.perf = perf
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.inflight = {}
+
+    def _cached(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires, member = entry
+        if expires < now:
+            del self.entries[key]
+            return False, None
+        return True, member
+
+    def _store(self, key, member, now):
+        self.entries[key] = (now + (self.ttl if member is not None else self.negative_ttl), member)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def forget(self, guild_id, user_id):
+        """Drop what is known about a user, e.g. when they join or leave."""
+        self.entries.pop((guild_id, str(user_id)), None)
+
+    async def resolve(self, guild, user_ids):
+        """Map user ids (str or int) to members; users not in the guild map to None."""
+        now = time.monotonic()
+        resolved = {}
+        missing = []
+        waiting = []
+        for uid in dict.fromkeys(str(u) for u in user_ids):
+            member = guild.get_member(int(uid))
+            if member is not None:
+                resolved[uid] = member
+                continue
+            key = (guild.id, uid)
+            hit, member = self._cached(key, now)
+            if hit:
+                resolved[uid] = member
+            elif key in self.inflight:
+                waiting.append((uid, self.inflight[key]))
+            else:
+                missing.append(uid)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {uid: loop.create_future() for uid in missing}
+            for uid, future in futures.items():
+                self.inflight[(guild.id, uid)] = future
+            found, complete = {}, False
+            try:
+                found, complete = await self._query(guild, missing)
+            finally:
+                now = time.monotonic()
+                for uid, future in futures.items():
+                    self.inflight.pop((guild.id, uid), None)
+                    member = found.get(uid)
+                    # After a failed request an absent id is unknown, not departed.
+                    if member is not None or complete:
+                        self._store((guild.id, uid), member, now)
+                    resolved[uid] = member
+                    future.set_result(member)
+
+        for uid, future in waiting:
+            resolved[uid] = await future
+        return resolved
+
+    async def _query(self, guild, user_ids):
+        """One gateway request per 100 ids, all in flight at once. Returns (found, whether every request succeeded)."""
+        started = time.perf_counter()
+        chunks = [
+            [int(uid) for uid in user_ids[i:i + QUERY_LIMIT]]
+            for i in range(0, len(user_ids), QUERY_LIMIT)
+        ]
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(guild.query_members(user_ids=chunk, limit=len(chunk), cache=True), self.timeout)
+                for chunk in chunks
+            ),
+            return_exceptions=True
+        )
+        if self.perf:
+            self.perf.observe("member lookups", "gateway_ms", (time.perf_counter() - started) * 1000)
+            self.perf.observe("member lookups", "ids", len(user_ids))
+        found = {}
+        complete = True
+        for result in results:
+            if isinstance(result, (asyncio.TimeoutError, discord.ClientException, discord.HTTPException)):
+                complete = False
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            for member in result:
+                found[str(member.id)] = member
+        return found, complete
@@ -1,31 +1,314 @@
+"""
+Bulk import/export for the stats database.
+
+    python migrate_stats.py                          # import ./stats.json (legacy behaviour)
+    python migrate_stats.py import dump.ndjson       # .json, .ndjson or .csv; --format to override
+    python migrate_stats.py import backup/           # restore a directory written by export
+    python migrate_stats.py export backup/           # stats.ndjson, teams.csv, team_members.csv
+    python migrate_stats.py from-arrays              # backfill event_entries from stats arrays
+    python migrate_stats.py partition                # hash-partition event_entries by guild
+
+Imports and exports work on one guild: --guild, required unless HOME_GUILD_ID is set.
+
+Imports are streamed: input is parsed incrementally and fed through one COPY
+into a temp staging table, then merged into stats/event_entries in a single
+transaction. Exports stream straight from COPY ... TO STDOUT into files.
+Memory use stays flat regardless of dump size.
+"""
+import argparse
+import csv
 import json
 import asyncpg
 import asyncio
 import os
+from event_utils import entry_record, entry_records
+from schema import migrate, partition_by_guild
 
-async def migrate_stats():
-    DATABASE_URL = os.getenv('DATABASE_URL')
-    conn = await asyncpg.connect(DATABASE_URL)
+INSERT_ENTRY = '''
+    INSERT INTO event_entries (guild_id, user_id, event_name, event, event_date, br_placement)
+    VALUES ($1, $2, $3, $4, $5, $6)
+'''
+
+STAGE_COLUMNS = ["kind", "seq", "ord", "guild_id", "user_id", "wins", "marathon_wins",
+                 "event_name", "event", "event_date", "br_placement"]
+
+CREATE_STAGE = '''
+    CREATE TEMP TABLE stage (
+        kind CHAR(1) NOT NULL,
+        seq BIGINT NOT NULL,
+        ord BIGINT NOT NULL,
+        guild_id BIGINT NOT NULL,
+        user_id TEXT NOT NULL,
+        wins INTEGER,
+        marathon_wins INTEGER,
+        event_name TEXT,
+        event TEXT,
+        event_date DATE,
+        br_placement TEXT
+    ) ON COMMIT DROP
+'''
+
+# Later rows for the same user replace earlier ones, matching the old per-user upsert.
+MERGE_STAGE = [
+    '''
+    CREATE TEMP TABLE stage_users ON COMMIT DROP AS
+    SELECT DISTINCT ON (guild_id, user_id) guild_id, user_id, seq, wins, marathon_wins
+    FROM stage WHERE kind = 's'
+    ORDER BY guild_id, user_id, seq DESC
+    ''',
+    '''
+    INSERT INTO stats (guild_id, user_id, wins, marathon_wins)
+    SELECT guild_id, user_id, COALESCE(wins, 0), marathon_wins FROM stage_users
+    ON CONFLICT (guild_id, user_id) DO UPDATE
+    SET wins = EXCLUDED.wins,
+        marathon_wins = COALESCE(EXCLUDED.marathon_wins, stats.marathon_wins)
+    ''',
+    '''
+    DELETE FROM event_entries e USING stage_users u
+    WHERE e.guild_id = u.guild_id AND e.user_id = u.user_id
+    ''',
+    '''
+    INSERT INTO event_entries (guild_id, user_id, event_name, event, event_date, br_placement)
+    SELECT s.guild_id, s.user_id, s.event_name, s.event, s.event_date, s.br_placement
+    FROM stage s
+    JOIN stage_users u ON u.guild_id = s.guild_id AND u.user_id = s.user_id AND u.seq = s.seq
+    WHERE s.kind = 'e'
+    ORDER BY s.ord
+    ''',
+]
+
+EXPORT_STATS = '''
+    SELECT json_build_object(
+        'user_id', s.user_id,
+        'wins', COALESCE(s.wins, 0),
+        'marathon_wins', COALESCE(s.marathon_wins, 0),
+        'entries', COALESCE(
+            (SELECT json_agg(json_build_array(e.event_name, e.br_placement) ORDER BY e.id)
+             FROM event_entries e WHERE e.guild_id = s.guild_id AND e.user_id = s.user_id),
+            '[]'::json
+        )
+    )
+    FROM stats s
+    WHERE s.guild_id = $1
+    ORDER BY s.user_id
+'''
+
+def iter_json_object(f, chunk_size=1 << 16):
+    """Yield (key, value) pairs from a top-level JSON object without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+        return not eof
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return ""
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more()
 
-    with open('stats.json', 'r') as f:
-        user_stats = json.load(f)
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {pos} of the current chunk")
+        pos += 1
 
-    for user_id, data in user_stats.items():
-        wins = data.get('wins', 0)
-        br = data.get('br', [])
-        events = data.get('events', [])
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        peek()
+        key = decode()
+        expect(":")
+        peek()
+        yield key, decode()
+        if peek() == "}":
+            return
+        expect(",")
 
+def read_users(path, fmt):
+    """Yield (user_id, data) for json, ndjson or csv dumps."""
+    with open(path, "r", newline="") as f:
+        if fmt == "json":
+            yield from iter_json_object(f)
+        elif fmt == "ndjson":
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield data["user_id"], data
+        elif fmt == "csv":
+            for row in csv.DictReader(f):
+                yield row["user_id"], {
+                    "wins": int(row.get("wins") or 0),
+                    "marathon_wins": int(row["marathon_wins"]) if row.get("marathon_wins") else None,
+                    "events": json.loads(row.get("events") or "[]"),
+                    "br": json.loads(row.get("br") or "[]"),
+                }
+        else:
+            raise ValueError(f"Unknown format {fmt}")
+
+def stage_rows(users, guild_id):
+    ord_ = 0
+    for seq, (user_id, data) in enumerate(users):
+        uid = str(user_id)
+        ord_ += 1
+        yield ("s", seq, ord_, guild_id, uid, data.get("wins", 0), data.get("marathon_wins"), None, None, None, None)
+        if "entries" in data:
+            records = (entry_record(uid, name, placement) for name, placement in data["entries"])
+        else:
+            records = entry_records(uid, data.get("events", []), data.get("br", data.get("br_placements", [])))
+        for _, event_name, event, event_date, placement in records:
+            ord_ += 1
+            yield ("e", seq, ord_, guild_id, uid, None, None, event_name, event, event_date, placement)
+
+async def import_users(conn, users, guild_id):
+    async with conn.transaction():
+        await conn.execute(CREATE_STAGE)
+        await conn.copy_records_to_table("stage", records=stage_rows(users, guild_id), columns=STAGE_COLUMNS)
+        for statement in MERGE_STAGE:
+            await conn.execute(statement)
+        return await conn.fetchval("SELECT COUNT(*) FROM stage_users")
+
+async def import_teams(conn, directory, guild_id):
+    """Restore teams by name into guild_id. Dump ids are only used to match
+    members to their team, so they never collide with another guild's teams."""
+    teams_path = os.path.join(directory, "teams.csv")
+    members_path = os.path.join(directory, "team_members.csv")
+    if not os.path.exists(teams_path):
+        if os.path.exists(members_path):
+            print(f"Skipping {members_path}: team memberships need teams.csv to resolve team names.")
+        return
+    async with conn.transaction():
+        await conn.execute("CREATE TEMP TABLE stage_teams (id INTEGER, name TEXT) ON COMMIT DROP")
+        await conn.copy_to_table("stage_teams", source=teams_path, format="csv", header=True)
         await conn.execute('''
-            INSERT INTO stats (user_id, wins, br_placements, events)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (user_id) DO UPDATE
-            SET wins = EXCLUDED.wins,
-                br_placements = EXCLUDED.br_placements,
-                events = EXCLUDED.events
-        ''', user_id, wins, br, events)
+            INSERT INTO teams (guild_id, name) SELECT $1, name FROM stage_teams
+            ON CONFLICT (guild_id, name) DO NOTHING
+        ''', guild_id)
+        if os.path.exists(members_path):
+            await conn.execute("CREATE TEMP TABLE stage_members (user_id TEXT, team_id INTEGER) ON COMMIT DROP")
+            await conn.copy_to_table("stage_members", source=members_path, format="csv", header=True)
+            await conn.execute('''
+                INSERT INTO team_members (guild_id, user_id, team_id)
+                SELECT $1, m.user_id, t.id
+                FROM stage_members m
+                JOIN stage_teams st ON st.id = m.team_id
+                JOIN teams t ON t.guild_id = $1 AND t.name = st.name
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET team_id = EXCLUDED.team_id
+            ''', guild_id)
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}.get(ext, "json")
+
+async def run_import(conn, path, guild_id, fmt=None):
+    if os.path.isdir(path):
+        count = await import_users(conn, read_users(os.path.join(path, "stats.ndjson"), "ndjson"), guild_id)
+        await import_teams(conn, path, guild_id)
+    else:
+        count = await import_users(conn, read_users(path, fmt or detect_format(path)), guild_id)
+    print(f"Imported {count} users from {path}.")
+
+async def run_export(conn, directory, guild_id):
+    os.makedirs(directory, exist_ok=True)
+    # csv with control-character quote/delimiter writes each JSON document verbatim, one per line
+    await conn.copy_from_query(
+        EXPORT_STATS, guild_id, output=os.path.join(directory, "stats.ndjson"),
+        format="csv", quote="\x01", delimiter="\x02"
+    )
+    await conn.copy_from_query(
+        "SELECT id, name FROM teams WHERE guild_id = $1 ORDER BY id", guild_id,
+        output=os.path.join(directory, "teams.csv"), format="csv", header=True
+    )
+    await conn.copy_from_query(
+        "SELECT user_id, team_id FROM team_members WHERE guild_id = $1 ORDER BY user_id", guild_id,
+        output=os.path.join(directory, "team_members.csv"), format="csv", header=True
+    )
+    print(f"Exported stats, teams and team_members to {directory}.")
+
+async def migrate_arrays(conn):
+    """Move the legacy stats.events/br_placements arrays into event_entries and
+    empty them, leaving the stats row compact. Users that already have entries
+    are skipped, so this is safe to re-run."""
+    rows = await conn.fetch('''
+        SELECT s.guild_id, s.user_id, s.events, s.br_placements FROM stats s
+        WHERE NOT EXISTS (SELECT 1 FROM event_entries e WHERE e.guild_id = s.guild_id AND e.user_id = s.user_id)
+    ''')
 
-    await conn.close()
-    print("Migration complete!")
+    migrated = 0
+    for row in rows:
+        records = entry_records(row['user_id'], row['events'], row['br_placements'])
+        if not records:
+            continue
+        async with conn.transaction():
+            await conn.executemany(INSERT_ENTRY, [(row['guild_id'], *record) for record in records])
+            await conn.execute(
+                "UPDATE stats SET events = '{}', br_placements = '{}' WHERE guild_id = $1 AND user_id = $2",
+                row['guild_id'], row['user_id']
+            )
+        migrated += 1
+
+    print(f"Migrated event history for {migrated} users.")
+
+def guild_id_arg(value):
+    guild_id = int(value)
+    if guild_id <= 0:
+        raise argparse.ArgumentTypeError(f"invalid guild id: {value}")
+    return guild_id
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    p_import = sub.add_parser("import")
+    p_import.add_argument("path")
+    p_import.add_argument("--format", choices=["json", "ndjson", "csv"])
+    p_export = sub.add_parser("export")
+    p_export.add_argument("directory")
+    sub.add_parser("from-arrays")
+    p_partition = sub.add_parser("partition")
+    p_partition.add_argument("--partitions", type=int, default=8)
+    home_guild = os.getenv("HOME_GUILD_ID")
+    parser.add_argument("--guild", type=guild_id_arg, default=home_guild, required=not home_guild)
+    args = parser.parse_args()
+
+    DATABASE_URL = os.getenv('DATABASE_URL')
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await migrate(conn, home_guild_id=args.guild)
+        if args.command == "export":
+            await run_export(conn, args.directory, args.guild)
+        elif args.command == "from-arrays":
+            await migrate_arrays(conn)
+        elif args.command == "partition":
+            await partition_by_guild(conn, args.partitions)
+            print(f"Partitioned event_entries into {args.partitions} partitions by guild.")
+        elif args.command == "import":
+            await run_import(conn, args.path, args.guild, args.format)
+        else:
+            await run_import(conn, "stats.json", args.guild, "json")
+    finally:
+        await conn.close()
 
 if __name__ == '__main__':
-    asyncio.run(migrate_stats())
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+
+Triggers on stats, event_entries, team_members and teams (schema migration
+10) publish a JSON payload on CHANGES_CHANNEL for every statement:
+
+    {"table": "stats", "guild_id": 123, "user_ids": ["456", ...]}
+
+user_ids is null for teams and for very large batches, meaning the whole
+guild changed. Notifications are delivered on commit, to every process
+listening, including the one that made the write.
+
+Each process keeps one dedicated connection (outside the pool) listening on
+the channel and hands every Change to its subscribers. If that connection
+drops, subscribers get a Change with guild_id None once it is back, since
+anything sent in between was missed.
+"""
+import asyncio
+import json
+import logging
+import asyncpg
+from schema import CHANGES_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+class Change:
+    __slots__ = ("table", "guild_id", "user_ids")
+
+    def __init__(self, table, guild_id, user_ids=None):
+        self.table = table
+        self.guild_id = guild_id
+        self.user_ids = user_ids
+
+    def __repr__(self):
+        return f"Change({self.table!r}, {self.guild_id!r}, {self.user_ids!r})"
+
+RESET = Change(None, None)
+
+class ChangeListener:
+    def __init__(self, dsn, retry_delay=5):
+        self.dsn = dsn
+        self.retry_delay = retry_delay
+        self.subscribers = []
+        self._conn = None
+        self._lost = None
+        self._task = None
+
+    def subscribe(self, callback):
+        """callback(change) is called for every notification; it must not block."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _dispatch(self, change):
+        for callback in list(self.subscribers):
+            try:
+                callback(change)
+            except Exception:
+                logger.exception(f"Change subscriber {callback!r} failed on {change!r}")
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+            change = Change(data["table"], data["guild_id"], data.get("user_ids"))
+        except (ValueError, KeyError):
+            logger.warning(f"Ignoring malformed change notification: {payload!r}")
+            return
+        self._dispatch(change)
+
+    def _on_terminate(self, conn):
+        if self._lost and not self._lost.done():
+            self._lost.set_result(None)
+
+    async def _connect(self):
+        conn = await asyncpg.connect(self.dsn)
+        await conn.add_listener(CHANGES_CHANNEL, self._on_notify)
+        conn.add_termination_listener(self._on_terminate)
+        self._conn = conn
+        self._lost = asyncio.get_running_loop().create_future()
+
+    async def start(self):
+        """Connect and start listening; reconnects in the background if the connection drops."""
+        await self._connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._lost
+            logger.warning(f"Lost the {CHANGES_CHANNEL} listener connection; reconnecting")
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except (OSError, asyncpg.PostgresError):
+                    await asyncio.sleep(self.retry_delay)
+            self._dispatch(RESET)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
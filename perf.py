@@ -0,0 +1,221 @@
+import contextvars
+import io
+import json
+import time
+from collections import deque, defaultdict
+import discord
+from discord.ext import commands
+
+current_sample = contextvars.ContextVar("current_sample", default=None)
+
+class Histogram:
+    """Rolling window of the most recent observations."""
+
+    def __init__(self, size=1000):
+        self.values = deque(maxlen=size)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def percentile(self, pct):
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            "count": len(self.values),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+class Sample:
+    __slots__ = ("name", "started", "db_time", "queries", "api_calls", "lock_wait")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.api_calls = 0
+        self.lock_wait = 0.0
+
+class PerfRecorder:
+    """Per-command wall time, DB time, query count, Discord API call count and per-user lock wait."""
+
+    METRICS = ("wall_ms", "db_ms", "queries", "api_calls", "lock_ms")
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.commands = defaultdict(lambda: {m: Histogram(self.window) for m in self.METRICS})
+        self.failures = defaultdict(int)
+
+    def observe(self, name, metric, value):
+        self.commands[name].setdefault(metric, Histogram(self.window)).add(value)
+
+    async def before_invoke(self, ctx):
+        ctx.perf_token = current_sample.set(Sample(ctx.command.qualified_name))
+
+    async def after_invoke(self, ctx):
+        sample = current_sample.get()
+        if sample is None:
+            return
+        histograms = self.commands[sample.name]
+        histograms["wall_ms"].add((time.perf_counter() - sample.started) * 1000)
+        histograms["db_ms"].add(sample.db_time * 1000)
+        histograms["queries"].add(sample.queries)
+        histograms["api_calls"].add(sample.api_calls)
+        histograms["lock_ms"].add(sample.lock_wait * 1000)
+        if ctx.command_failed:
+            self.failures[sample.name] += 1
+        current_sample.reset(ctx.perf_token)
+
+    def record_query(self, elapsed):
+        sample = current_sample.get()
+        if sample is not None:
+            sample.db_time += elapsed
+            sample.queries += 1
+
+    def record_lock_wait(self, elapsed):
+        sample = current_sample.get()
+        if sample is not None:
+            sample.lock_wait += elapsed
+        self.observe("user locks", "wait_ms", elapsed * 1000)
+
+    def instrument_http(self, http):
+        """Count every REST call made while a command is running."""
+        request = http.request
+
+        async def counted_request(route, **kwargs):
+            sample = current_sample.get()
+            if sample is not None:
+                sample.api_calls += 1
+            return await request(route, **kwargs)
+
+        http.request = counted_request
+
+    def snapshot(self):
+        return {
+            name: {
+                **{metric: hist.summary() for metric, hist in histograms.items()},
+                "failures": self.failures.get(name, 0),
+            }
+            for name, histograms in self.commands.items()
+        }
+
+    def dumps(self):
+        return json.dumps({"generated_at": time.time(), "commands": self.snapshot()}, indent=2)
+
+def _timed(perf, func):
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            perf.record_query(time.perf_counter() - started)
+
+    return timed
+
+class InstrumentedConnection:
+    """Wraps an asyncpg connection and times every query it runs."""
+
+    TIMED = ("execute", "executemany", "fetch", "fetchrow", "fetchval",
+             "copy_records_to_table", "copy_from_query", "copy_to_table",
+             "fetch_named", "fetchrow_named", "fetchval_named", "execute_named")
+
+    def __init__(self, conn, perf):
+        self._conn = conn
+        self._perf = perf
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        return _timed(self._perf, attr) if name in self.TIMED else attr
+
+class _AcquireContext:
+    def __init__(self, ctx, perf):
+        self._ctx = ctx
+        self._perf = perf
+
+    async def __aenter__(self):
+        conn = await self._ctx.__aenter__()
+        return InstrumentedConnection(conn, self._perf)
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+class InstrumentedPool:
+    """Drop-in wrapper for the asyncpg pool handed to the cogs."""
+
+    def __init__(self, pool, perf):
+        self._pool = pool
+        self._perf = perf
+
+    def acquire(self, **kwargs):
+        return _AcquireContext(self._pool.acquire(**kwargs), self._perf)
+
+    def __getattr__(self, name):
+        attr = getattr(self._pool, name)
+        return _timed(self._perf, attr) if name in InstrumentedConnection.TIMED else attr
+
+class PerfCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def perf(self, ctx, action: str = None):
+        """Show per-command latency percentiles, or `!perf dump` to download them as JSON."""
+        perf = self.bot.perf
+        if action == "dump":
+            data = io.BytesIO(perf.dumps().encode())
+            await ctx.send("📁 Performance data:", file=discord.File(data, filename=f"perf-{int(time.time())}.json"))
+            return
+
+        snapshot = perf.snapshot()
+        if not snapshot:
+            await ctx.send("No commands recorded yet.")
+            return
+
+        embed = discord.Embed(title="⏱️ Command Performance", color=discord.Color.dark_teal())
+        ranked = sorted(
+            ((name, data) for name, data in snapshot.items() if data["wall_ms"]["count"]),
+            key=lambda item: item[1]["wall_ms"]["p95"],
+            reverse=True
+        )
+        for name, data in ranked[:25]:
+            wall = data["wall_ms"]
+            embed.add_field(
+                name=f"!{name} ({wall['count']} runs, {data['failures']} failed)",
+                value=(
+                    f"Wall p50/p95/p99: {wall['p50']:.0f}/{wall['p95']:.0f}/{wall['p99']:.0f} ms\n"
+                    f"DB p95: {data['db_ms']['p95']:.0f} ms · "
+                    f"Queries p95: {data['queries']['p95']:.0f} · "
+                    f"API calls p95: {data['api_calls']['p95']:.0f} · "
+                    f"Lock wait p95: {data['lock_ms']['p95']:.0f} ms"
+                ),
+                inline=False
+            )
+        footer = []
+        locks = snapshot.get("user locks")
+        if locks:
+            waits = locks["wait_ms"]
+            footer.append(f"Per-user locks: {waits['count']} acquisitions, wait p95/p99 {waits['p95']:.0f}/{waits['p99']:.0f} ms")
+        standings = snapshot.get("standings snapshot")
+        if standings:
+            build, age = standings["build_ms"], standings["age_s"]
+            footer.append(
+                f"Standings snapshots: {build['count']} built, build p95 {build['p95']:.0f} ms, "
+                f"age p95 {age['p95']:.0f} s when read"
+            )
+        renders = self.bot.renders
+        if renders.hits or renders.misses:
+            footer.append(f"Rendered pages: {renders.hits / (renders.hits + renders.misses):.0%} served from cache")
+        if footer:
+            embed.set_footer(text="\n".join(footer))
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(PerfCog(bot))
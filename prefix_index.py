@@ -0,0 +1,68 @@
+import heapq
+
+class _Node:
+    __slots__ = ("children", "names", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.names = set()
+        self.top = None
+
+class PrefixIndex:
+    """
+    Case-insensitive prefix trie for autocomplete. Every word start of a name
+    is indexed, so "seek" finds "Hide and Seek". Each node caches its best
+    completions (by weight, then alphabetically) until a name under it
+    changes, so a lookup is a walk of len(prefix) nodes.
+    """
+
+    def __init__(self, limit=25):
+        self.limit = limit
+        self.root = _Node()
+        self.weights = {}
+        self.display = {}
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __contains__(self, name):
+        return " ".join(name.lower().split()) in self.display
+
+    def _keys(self, name):
+        words = name.lower().split()
+        return {" ".join(words[i:]) for i in range(len(words))}
+
+    def add(self, name, weight=1):
+        """
+        Insert name, or raise its weight if it is already indexed. Names that
+        differ only in case share the spelling they were first added with.
+        """
+        name = " ".join(name.split())
+        if not name:
+            return
+        name = self.display.setdefault(name.lower(), name)
+        is_new = name not in self.weights
+        self.weights[name] = self.weights.get(name, 0) + weight
+        for key in self._keys(name):
+            node = self.root
+            node.top = None
+            if is_new:
+                node.names.add(name)
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                node.top = None
+                if is_new:
+                    node.names.add(name)
+
+    def complete(self, prefix, limit=None):
+        limit = limit or self.limit
+        node = self.root
+        for char in " ".join(prefix.lower().split()):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        if node.top is None:
+            node.top = heapq.nsmallest(
+                self.limit, node.names, key=lambda n: (-self.weights[n], n.lower())
+            )
+        return node.top[:limit]
@@ -0,0 +1,199 @@
+"""
+The hot statements used by EventCog and TeamCog, declared once by name.
+
+Every pooled connection prepares the whole registry when it is opened (the
+pool `init` hook), so the first command after a deploy or reconnect runs the
+same server-side plans as every later one. Cogs call them through
+conn.fetch_named(name, *args) and friends.
+"""
+import logging
+import os
+import time
+from datetime import date
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Every statement is scoped to one guild, passed as $1.
+QUERIES = {
+    # EventCog
+    # The stats row carries only counters and the latest events; older
+    # history is read a page at a time with user_history.
+    "user_stats": """
+        SELECT s.wins, s.marathon_wins, s.event_count, s.recent_events,
+               ARRAY(
+                   SELECT e.br_placement FROM event_entries e
+                   WHERE e.guild_id = s.guild_id AND e.user_id = s.user_id AND e.br_placement IS NOT NULL
+                   ORDER BY e.id
+               ) AS br_placements
+        FROM stats s
+        WHERE s.guild_id = $1 AND s.user_id = $2
+    """,
+    "user_history": """
+        SELECT id, event_name FROM event_entries
+        WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL AND id > $3
+        ORDER BY id
+        LIMIT $4
+    """,
+    "user_event_counts": """
+        SELECT event_name, COUNT(*) AS entries FROM event_entries
+        WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL
+        GROUP BY event_name
+    """,
+    # Rows whose op_id is already stored (a replayed write-behind op) are
+    # skipped, and only rows actually inserted count towards wins.
+    "add_event_entries": """
+        WITH input AS (
+            SELECT * FROM unnest(
+                $1::bigint[], $2::text[], $3::text[], $4::text[], $5::date[], $6::text[], $7::int[], $8::text[]
+            ) WITH ORDINALITY AS t(guild_id, user_id, event_name, event, event_date, br_placement, wins, op_id, ord)
+        ), inserted AS (
+            INSERT INTO event_entries (guild_id, user_id, event_name, event, event_date, br_placement, op_id)
+            SELECT guild_id, user_id, event_name, event, event_date, br_placement, op_id FROM input ORDER BY ord
+            ON CONFLICT (guild_id, op_id) DO NOTHING
+            RETURNING guild_id, op_id
+        )
+        INSERT INTO stats (guild_id, user_id, wins, marathon_wins)
+        SELECT i.guild_id, i.user_id, SUM(i.wins), 0
+        FROM input i JOIN inserted USING (guild_id, op_id)
+        GROUP BY i.guild_id, i.user_id
+        ON CONFLICT (guild_id, user_id) DO UPDATE
+        SET wins = COALESCE(stats.wins, 0) + EXCLUDED.wins
+    """,
+    "search_events": """
+        SELECT id, user_id, event_name, COALESCE(event_date, '-infinity'::date) AS sort_date
+        FROM event_entries
+        WHERE guild_id = $1 AND event_name ILIKE $2
+          AND (COALESCE(event_date, '-infinity'::date), id) < ($3, $4)
+        ORDER BY COALESCE(event_date, '-infinity'::date) DESC, id DESC
+        LIMIT $5
+    """,
+    # TeamCog
+    "user_has_events": """
+        SELECT EXISTS (
+            SELECT 1 FROM event_entries WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL
+        )
+    """,
+    "team_id_by_name": "SELECT id FROM teams WHERE guild_id = $1 AND LOWER(name) = LOWER($2)",
+    "user_team": "SELECT team_id FROM team_members WHERE guild_id = $1 AND user_id = $2",
+    "user_teams": """
+        SELECT tm.user_id, t.name FROM team_members tm
+        JOIN teams t ON t.id = tm.team_id
+        WHERE tm.guild_id = $1 AND tm.user_id = ANY($2::text[])
+    """,
+    "team_name": "SELECT name FROM teams WHERE guild_id = $1 AND id = $2",
+    "team_members": "SELECT user_id FROM team_members WHERE guild_id = $1 AND team_id = $2",
+    "team_standings": """
+        SELECT t.id, t.name, t.emoji,
+               COALESCE(tt.wins, 0) AS wins,
+               COALESCE(tt.points, 0) AS points,
+               ARRAY(SELECT m.user_id FROM team_members m WHERE m.team_id = t.id ORDER BY m.user_id) AS members,
+               ARRAY(
+                   SELECT tp.placement || ' ×' || tp.count FROM team_placements tp
+                   LEFT JOIN team_points p ON p.placement = tp.placement
+                   WHERE tp.team_id = t.id AND tp.count > 0
+                   ORDER BY COALESCE(p.points, 0) DESC, tp.placement
+               ) AS br_placements
+        FROM teams t
+        LEFT JOIN team_totals tt ON tt.team_id = t.id
+        WHERE t.guild_id = $1 AND ($2::bigint IS NULL OR t.id = $2)
+        ORDER BY points DESC, t.name
+    """,
+}
+
+SEARCH_MAX_ID = 2**63 - 1
+
+def search_args(term, after=None):
+    """
+    (pattern, after_date, after_id) for search_events: a substring match on
+    term, continuing after the (sort_date, id) of the previous page's last row.
+    """
+    pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    after_date, after_id = after or (date.max, SEARCH_MAX_ID)
+    return pattern, after_date, after_id
+
+async def lock_guild_writes(conn, guild_ids, exclusive=False):
+    """
+    Take the per-guild write lock for the current transaction. Every write to
+    event_entries, stats.wins or team membership holds it shared; set-based
+    rebuilds of one
+    guild (!recalc all, team reconciliation) hold it exclusive, so they only
+    wait for, and block, writers in that guild.
+    """
+    func = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    await conn.execute(
+        f"SELECT {func}(hashtext('guild_writes'), hashtext(g::text)) FROM unnest($1::bigint[]) g",
+        sorted(set(guild_ids))
+    )
+
+class RegistryConnection(asyncpg.Connection):
+    """asyncpg connection that keeps a prepared statement for every entry in QUERIES."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared = {}
+
+    async def prepare_registry(self):
+        for name, query in QUERIES.items():
+            self._prepared[name] = await self.prepare(query)
+
+    async def _statement(self, name):
+        statement = self._prepared.get(name)
+        if statement is None:
+            statement = self._prepared[name] = await self.prepare(QUERIES[name])
+        return statement
+
+    async def _run(self, name, method, args):
+        statement = await self._statement(name)
+        try:
+            return await getattr(statement, method)(*args)
+        except (asyncpg.InvalidCachedStatementError, asyncpg.OutdatedSchemaCacheError):
+            # The schema changed under a live connection; re-prepare once.
+            self._prepared.pop(name, None)
+            if self.is_in_transaction():
+                raise
+            statement = await self._statement(name)
+            return await getattr(statement, method)(*args)
+
+    async def fetch_named(self, name, *args):
+        return await self._run(name, "fetch", args)
+
+    async def fetchrow_named(self, name, *args):
+        return await self._run(name, "fetchrow", args)
+
+    async def fetchval_named(self, name, *args):
+        return await self._run(name, "fetchval", args)
+
+    async def execute_named(self, name, *args):
+        """Run a statement for its side effects and return the command status, like execute()."""
+        await self._run(name, "fetch", args)
+        return self._prepared[name].get_statusmsg()
+
+def pool_settings():
+    """Pool sizing and timeouts, overridable through the environment."""
+    return {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "4")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")),
+        "command_timeout": float(os.getenv("DB_COMMAND_TIMEOUT", "30")),
+        "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    }
+
+async def _init_connection(conn):
+    await conn.prepare_registry()
+
+async def create_pool(dsn, **overrides):
+    """
+    Create the bot's pool. The first min_size connections are opened and have
+    the registry prepared before this returns, so the pool starts warm.
+    """
+    settings = {**pool_settings(), **overrides}
+    started = time.perf_counter()
+    pool = await asyncpg.create_pool(
+        dsn, connection_class=RegistryConnection, init=_init_connection, **settings
+    )
+    logger.info(
+        f"Database pool ready: {settings['min_size']}-{settings['max_size']} connections, "
+        f"{len(QUERIES)} prepared statements each, warmed in {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return pool
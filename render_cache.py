@@ -0,0 +1,53 @@
+import inspect
+from collections import OrderedDict
+
+class RenderCache:
+    """
+    Built embeds for paged views, shared by every user of the bot.
+
+    Entries are keyed by (view, guild_id, query, page) and tagged with the
+    guild's data version when they were built. Any write to a guild's stats,
+    events or teams bumps its version, so an entry is only served while the
+    data it was built from is current. Views with static content use
+    guild_id None, whose version only changes on a full reset.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, guild_id):
+        return (self.epoch, self.versions.get(guild_id, 0))
+
+    def bump(self, guild_id=None):
+        """Mark a guild's data as changed; with no guild, everything."""
+        if guild_id is None:
+            self.epoch += 1
+            self.entries.clear()
+        else:
+            self.versions[guild_id] = self.versions.get(guild_id, 0) + 1
+
+    async def render(self, view, guild_id, query, page, build):
+        """Return the cached value for this page, or call build() (sync or async) and cache it."""
+        key = (view, guild_id, query, page)
+        version = self.version(guild_id)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        if inspect.isawaitable(value):
+            value = await value
+        # A write that landed while building means the value may already be stale.
+        if self.version(guild_id) == version:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
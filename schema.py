@@ -0,0 +1,675 @@
+"""
+Versioned schema migrations, applied at startup by main() in bot.py.
+
+Each migration runs once, in its own transaction, and is recorded in
+schema_migrations. The early migrations use IF NOT EXISTS / OR REPLACE so
+they also apply cleanly to databases whose tables were created by hand.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def statement_triggers(table, function):
+    """
+    Statement-level AFTER triggers, one per operation, so the function sees
+    the whole batch of changed rows through its transition tables.
+    """
+    return [
+        f"DROP TRIGGER IF EXISTS {function}_ins ON {table}",
+        f"DROP TRIGGER IF EXISTS {function}_del ON {table}",
+        f"DROP TRIGGER IF EXISTS {function}_upd ON {table}",
+        f"""
+        CREATE TRIGGER {function}_ins AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+        """,
+        f"""
+        CREATE TRIGGER {function}_del AFTER DELETE ON {table}
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+        """,
+        f"""
+        CREATE TRIGGER {function}_upd AFTER UPDATE ON {table}
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+        """,
+    ]
+
+def replace_primary_key(table, columns):
+    """
+    Swap a table's primary key for one on columns. The old key is looked up
+    in pg_constraint, since hand-made tables may not use the default name.
+    """
+    return f"""
+    DO $$
+    DECLARE
+        pkey TEXT;
+    BEGIN
+        SELECT conname INTO pkey FROM pg_constraint
+        WHERE conrelid = '{table}'::regclass AND contype = 'p';
+        IF pkey IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE {table} DROP CONSTRAINT %I', pkey);
+        END IF;
+        ALTER TABLE {table} ADD PRIMARY KEY ({columns});
+    END
+    $$
+    """
+
+# Guild-scoped indexes on event_entries, shared by migrations 9 and 11 and partition_by_guild().
+EVENT_ENTRIES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS event_entries_user_idx ON event_entries (guild_id, user_id, id)",
+    "CREATE INDEX IF NOT EXISTS event_entries_event_date_idx ON event_entries (guild_id, event, event_date)",
+    "CREATE INDEX IF NOT EXISTS event_entries_name_trgm_idx ON event_entries USING gin (guild_id, event_name gin_trgm_ops)",
+    """
+    CREATE INDEX IF NOT EXISTS event_entries_sort_date_idx
+    ON event_entries (guild_id, (COALESCE(event_date, '-infinity'::date)), id)
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS event_entries_op_id_idx ON event_entries (guild_id, op_id)",
+    """
+    CREATE INDEX IF NOT EXISTS event_entries_br_idx
+    ON event_entries (guild_id, user_id, id) WHERE br_placement IS NOT NULL
+    """,
+]
+
+EVENT_ENTRIES_TRIGGERS = (
+    statement_triggers("event_entries", "event_entries_br_count")
+    + statement_triggers("event_entries", "event_entries_team_totals")
+)
+
+# Channel the change-notification triggers publish on; see notify.py.
+CHANGES_CHANNEL = "db_changes"
+
+EVENT_ENTRIES_NOTIFY = statement_triggers("event_entries", "notify_user_changes")
+
+# How many of a player's latest events their stats row keeps inline. The full
+# history stays in event_entries and is only read by the commands that page
+# through it.
+RECENT_EVENTS = 10
+
+EVENT_ENTRIES_HISTORY = statement_triggers("event_entries", "event_entries_history")
+
+MIGRATIONS = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS stats (
+            user_id TEXT PRIMARY KEY,
+            wins INTEGER DEFAULT 0,
+            br_placements TEXT[] DEFAULT '{}',
+            events TEXT[] DEFAULT '{}',
+            marathon_wins INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS team_members (
+            user_id TEXT PRIMARY KEY,
+            team_id INTEGER NOT NULL REFERENCES teams(id)
+        )
+        """,
+    ]),
+    (2, "event_entries", [
+        """
+        CREATE TABLE IF NOT EXISTS event_entries (
+            id BIGSERIAL PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            event_name TEXT,
+            event TEXT,
+            event_date DATE,
+            br_placement TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS event_entries_user_idx ON event_entries (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS event_entries_event_date_idx ON event_entries (event, event_date)",
+    ]),
+    (3, "event search indexes", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS event_entries_name_trgm_idx ON event_entries USING gin (event_name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS event_entries_sort_date_idx ON event_entries ((COALESCE(event_date, '-infinity'::date)), id)",
+    ]),
+    (4, "team_points", [
+        """
+        CREATE TABLE IF NOT EXISTS team_points (
+            placement TEXT PRIMARY KEY,
+            points INTEGER NOT NULL
+        )
+        """,
+    ]),
+    (5, "leaderboard br_count", [
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'stats' AND column_name = 'br_count'
+            ) THEN
+                UPDATE stats SET wins = 0 WHERE wins IS NULL;
+                ALTER TABLE stats ALTER COLUMN wins SET DEFAULT 0, ALTER COLUMN wins SET NOT NULL;
+                ALTER TABLE stats ADD COLUMN br_count INTEGER NOT NULL DEFAULT 0;
+                UPDATE stats s SET br_count = c.n
+                FROM (
+                    SELECT user_id, COUNT(*) AS n FROM event_entries
+                    WHERE br_placement IS NOT NULL GROUP BY user_id
+                ) c
+                WHERE s.user_id = c.user_id;
+            END IF;
+        END $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION event_entries_br_count() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE stats s SET br_count = s.br_count - c.n
+                FROM (SELECT user_id, COUNT(*) AS n FROM old_rows WHERE br_placement IS NOT NULL GROUP BY user_id) c
+                WHERE s.user_id = c.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE stats s SET br_count = s.br_count + c.n
+                FROM (SELECT user_id, COUNT(*) AS n FROM new_rows WHERE br_placement IS NOT NULL GROUP BY user_id) c
+                WHERE s.user_id = c.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "CREATE INDEX IF NOT EXISTS stats_leaderboard_idx ON stats (wins, br_count, user_id)",
+    ] + statement_triggers("event_entries", "event_entries_br_count")),
+    (6, "team totals", [
+        """
+        CREATE TABLE IF NOT EXISTS team_totals (
+            team_id INTEGER PRIMARY KEY REFERENCES teams(id) ON DELETE CASCADE,
+            wins BIGINT NOT NULL DEFAULT 0,
+            points BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS team_placements (
+            team_id INTEGER NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+            placement TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (team_id, placement)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION team_totals_add(team_ids INTEGER[], wins BIGINT[]) RETURNS void AS $$
+            INSERT INTO team_totals (team_id, wins, points)
+            SELECT d.team_id, SUM(d.wins), SUM(d.wins) * 100
+            FROM unnest(team_ids, wins) AS d(team_id, wins)
+            GROUP BY d.team_id
+            ON CONFLICT (team_id) DO UPDATE
+            SET wins = team_totals.wins + EXCLUDED.wins,
+                points = team_totals.points + EXCLUDED.points
+        $$ LANGUAGE sql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION team_placements_add(team_ids INTEGER[], placements TEXT[], deltas BIGINT[]) RETURNS void AS $$
+            WITH d AS (
+                SELECT u.team_id, lower(u.placement) AS placement, SUM(u.delta) AS n
+                FROM unnest(team_ids, placements, deltas) AS u(team_id, placement, delta)
+                GROUP BY u.team_id, lower(u.placement)
+            ), hist AS (
+                INSERT INTO team_placements (team_id, placement, count)
+                SELECT team_id, placement, n FROM d
+                ON CONFLICT (team_id, placement) DO UPDATE
+                SET count = team_placements.count + EXCLUDED.count
+            )
+            INSERT INTO team_totals (team_id, wins, points)
+            SELECT d.team_id, 0, SUM(d.n * COALESCE(tp.points, 0))
+            FROM d LEFT JOIN team_points tp ON tp.placement = d.placement
+            GROUP BY d.team_id
+            ON CONFLICT (team_id) DO UPDATE
+            SET points = team_totals.points + EXCLUDED.points
+        $$ LANGUAGE sql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION stats_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(-o.wins::bigint))
+                FROM old_rows o JOIN team_members tm ON tm.user_id = o.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(n.wins::bigint))
+                FROM new_rows n JOIN team_members tm ON tm.user_id = n.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION event_entries_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_placements_add(array_agg(tm.team_id), array_agg(o.br_placement), array_agg(-1::bigint))
+                FROM old_rows o JOIN team_members tm ON tm.user_id = o.user_id
+                WHERE o.br_placement IS NOT NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_placements_add(array_agg(tm.team_id), array_agg(n.br_placement), array_agg(1::bigint))
+                FROM new_rows n JOIN team_members tm ON tm.user_id = n.user_id
+                WHERE n.br_placement IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION team_members_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(o.team_id), array_agg(-COALESCE(s.wins, 0)::bigint))
+                FROM old_rows o LEFT JOIN stats s ON s.user_id = o.user_id;
+                PERFORM team_placements_add(array_agg(o.team_id), array_agg(e.br_placement), array_agg(-1::bigint))
+                FROM old_rows o JOIN event_entries e ON e.user_id = o.user_id
+                WHERE e.br_placement IS NOT NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(n.team_id), array_agg(COALESCE(s.wins, 0)::bigint))
+                FROM new_rows n LEFT JOIN stats s ON s.user_id = n.user_id;
+                PERFORM team_placements_add(array_agg(n.team_id), array_agg(e.br_placement), array_agg(1::bigint))
+                FROM new_rows n JOIN event_entries e ON e.user_id = n.user_id
+                WHERE e.br_placement IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]
+        + statement_triggers("stats", "stats_team_totals")
+        + statement_triggers("event_entries", "event_entries_team_totals")
+        + statement_triggers("team_members", "team_members_team_totals")),
+    (7, "hot query indexes", [
+        "CREATE INDEX IF NOT EXISTS teams_lower_name_idx ON teams (LOWER(name))",
+        "CREATE INDEX IF NOT EXISTS team_members_team_id_idx ON team_members (team_id, user_id)",
+        "ANALYZE stats",
+        "ANALYZE teams",
+        "ANALYZE team_members",
+        "ANALYZE event_entries",
+    ]),
+    (8, "event_entries op_id", [
+        "ALTER TABLE event_entries ADD COLUMN IF NOT EXISTS op_id TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS event_entries_op_id_idx ON event_entries (op_id)",
+    ]),
+    (9, "guild partitioning", [
+        # Rows from before multi-guild support belong to the home guild passed to migrate().
+        *(
+            f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS guild_id BIGINT;
+            UPDATE {table} SET guild_id = current_setting('app.home_guild_id')::bigint WHERE guild_id IS NULL;
+            ALTER TABLE {table} ALTER COLUMN guild_id SET NOT NULL
+            """
+            for table in ("stats", "event_entries", "teams", "team_members")
+        ),
+        replace_primary_key("stats", "guild_id, user_id"),
+        "DROP INDEX IF EXISTS stats_leaderboard_idx",
+        "CREATE INDEX stats_leaderboard_idx ON stats (guild_id, wins, br_count, user_id)",
+        "ALTER TABLE teams ADD COLUMN IF NOT EXISTS emoji TEXT",
+        "ALTER TABLE teams DROP CONSTRAINT IF EXISTS teams_name_key",
+        "ALTER TABLE teams ADD CONSTRAINT teams_guild_id_name_key UNIQUE (guild_id, name)",
+        "ALTER TABLE teams ADD CONSTRAINT teams_guild_id_id_key UNIQUE (guild_id, id)",
+        "DROP INDEX IF EXISTS teams_lower_name_idx",
+        "CREATE INDEX teams_lower_name_idx ON teams (guild_id, LOWER(name))",
+        replace_primary_key("team_members", "guild_id, user_id"),
+        "ALTER TABLE team_members DROP CONSTRAINT IF EXISTS team_members_team_id_fkey",
+        """
+        ALTER TABLE team_members ADD CONSTRAINT team_members_guild_team_fkey
+        FOREIGN KEY (guild_id, team_id) REFERENCES teams (guild_id, id)
+        """,
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        "DROP INDEX IF EXISTS event_entries_user_idx",
+        "DROP INDEX IF EXISTS event_entries_event_date_idx",
+        "DROP INDEX IF EXISTS event_entries_name_trgm_idx",
+        "DROP INDEX IF EXISTS event_entries_sort_date_idx",
+        "DROP INDEX IF EXISTS event_entries_op_id_idx",
+        *EVENT_ENTRIES_INDEXES,
+        """
+        CREATE OR REPLACE FUNCTION event_entries_br_count() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE stats s SET br_count = s.br_count - c.n
+                FROM (
+                    SELECT guild_id, user_id, COUNT(*) AS n FROM old_rows
+                    WHERE br_placement IS NOT NULL GROUP BY guild_id, user_id
+                ) c
+                WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE stats s SET br_count = s.br_count + c.n
+                FROM (
+                    SELECT guild_id, user_id, COUNT(*) AS n FROM new_rows
+                    WHERE br_placement IS NOT NULL GROUP BY guild_id, user_id
+                ) c
+                WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION stats_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(-o.wins::bigint))
+                FROM old_rows o JOIN team_members tm ON tm.guild_id = o.guild_id AND tm.user_id = o.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(n.wins::bigint))
+                FROM new_rows n JOIN team_members tm ON tm.guild_id = n.guild_id AND tm.user_id = n.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION event_entries_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_placements_add(array_agg(tm.team_id), array_agg(o.br_placement), array_agg(-1::bigint))
+                FROM old_rows o JOIN team_members tm ON tm.guild_id = o.guild_id AND tm.user_id = o.user_id
+                WHERE o.br_placement IS NOT NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_placements_add(array_agg(tm.team_id), array_agg(n.br_placement), array_agg(1::bigint))
+                FROM new_rows n JOIN team_members tm ON tm.guild_id = n.guild_id AND tm.user_id = n.user_id
+                WHERE n.br_placement IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION team_members_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(o.team_id), array_agg(-COALESCE(s.wins, 0)::bigint))
+                FROM old_rows o LEFT JOIN stats s ON s.guild_id = o.guild_id AND s.user_id = o.user_id;
+                PERFORM team_placements_add(array_agg(o.team_id), array_agg(e.br_placement), array_agg(-1::bigint))
+                FROM old_rows o JOIN event_entries e ON e.guild_id = o.guild_id AND e.user_id = o.user_id
+                WHERE e.br_placement IS NOT NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM team_totals_add(array_agg(n.team_id), array_agg(COALESCE(s.wins, 0)::bigint))
+                FROM new_rows n LEFT JOIN stats s ON s.guild_id = n.guild_id AND s.user_id = n.user_id;
+                PERFORM team_placements_add(array_agg(n.team_id), array_agg(e.br_placement), array_agg(1::bigint))
+                FROM new_rows n JOIN event_entries e ON e.guild_id = n.guild_id AND e.user_id = n.user_id
+                WHERE e.br_placement IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "ANALYZE stats",
+        "ANALYZE teams",
+        "ANALYZE team_members",
+        "ANALYZE event_entries",
+    ]),
+    (10, "change notifications", [
+        # One NOTIFY per guild per statement; big batches (over 200 users)
+        # send user_ids = null, meaning the whole guild changed.
+        f"""
+        CREATE OR REPLACE FUNCTION notify_users(tbl TEXT, guild_ids BIGINT[], user_ids TEXT[]) RETURNS void AS $$
+        BEGIN
+            PERFORM pg_notify('{CHANGES_CHANNEL}', json_build_object(
+                'table', tbl,
+                'guild_id', c.guild_id,
+                'user_ids', CASE WHEN COUNT(*) <= 200 THEN array_agg(c.user_id) END
+            )::text)
+            FROM (SELECT DISTINCT * FROM unnest(guild_ids, user_ids) AS u(guild_id, user_id)) c
+            GROUP BY c.guild_id;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION notify_user_changes() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM notify_users(TG_TABLE_NAME, array_agg(guild_id), array_agg(user_id)) FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM notify_users(TG_TABLE_NAME, array_agg(guild_id), array_agg(user_id)) FROM old_rows;
+            ELSE
+                PERFORM notify_users(TG_TABLE_NAME, array_agg(guild_id), array_agg(user_id))
+                FROM (SELECT guild_id, user_id FROM old_rows UNION SELECT guild_id, user_id FROM new_rows) c;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION notify_team_changes() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM pg_notify('{CHANGES_CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'guild_id', guild_id)::text)
+                FROM (SELECT DISTINCT guild_id FROM old_rows) g;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM pg_notify('{CHANGES_CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'guild_id', guild_id)::text)
+                FROM (SELECT DISTINCT guild_id FROM new_rows) g;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        *statement_triggers("stats", "notify_user_changes"),
+        *statement_triggers("team_members", "notify_user_changes"),
+        *EVENT_ENTRIES_NOTIFY,
+        *statement_triggers("teams", "notify_team_changes"),
+    ]),
+    (11, "compact player rows", [
+        """
+        ALTER TABLE stats
+            ADD COLUMN IF NOT EXISTS event_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS recent_events TEXT[] NOT NULL DEFAULT '{}'
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION latest_events(gid BIGINT, uid TEXT) RETURNS TEXT[] AS $$
+            SELECT COALESCE(array_agg(event_name ORDER BY id), '{{}}')
+            FROM (
+                SELECT id, event_name FROM event_entries
+                WHERE guild_id = gid AND user_id = uid AND event_name IS NOT NULL
+                ORDER BY id DESC
+                LIMIT {RECENT_EVENTS}
+            ) r
+        $$ LANGUAGE sql STABLE
+        """,
+        """
+        UPDATE stats s SET event_count = c.n, recent_events = latest_events(s.guild_id, s.user_id)
+        FROM (
+            SELECT guild_id, user_id, COUNT(event_name)::int AS n FROM event_entries GROUP BY guild_id, user_id
+        ) c
+        WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id
+        """,
+        # The legacy arrays are dead weight once a player's history is in
+        # event_entries; rows not yet moved over keep them for from-arrays.
+        """
+        UPDATE stats s SET events = '{}', br_placements = '{}'
+        WHERE (s.events <> '{}' OR s.br_placements <> '{}')
+          AND EXISTS (SELECT 1 FROM event_entries e WHERE e.guild_id = s.guild_id AND e.user_id = s.user_id)
+        """,
+        """
+        CREATE OR REPLACE FUNCTION event_entries_history() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE stats s SET event_count = s.event_count + c.n, recent_events = latest_events(s.guild_id, s.user_id)
+                FROM (SELECT guild_id, user_id, COUNT(event_name) AS n FROM new_rows GROUP BY guild_id, user_id) c
+                WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE stats s SET event_count = s.event_count - c.n, recent_events = latest_events(s.guild_id, s.user_id)
+                FROM (SELECT guild_id, user_id, COUNT(event_name) AS n FROM old_rows GROUP BY guild_id, user_id) c
+                WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id;
+            ELSE
+                UPDATE stats s SET event_count = s.event_count + c.n, recent_events = latest_events(s.guild_id, s.user_id)
+                FROM (
+                    SELECT guild_id, user_id, SUM(n)::int AS n FROM (
+                        SELECT guild_id, user_id, -COUNT(event_name) AS n FROM old_rows GROUP BY guild_id, user_id
+                        UNION ALL
+                        SELECT guild_id, user_id, COUNT(event_name) FROM new_rows GROUP BY guild_id, user_id
+                    ) d
+                    GROUP BY guild_id, user_id
+                ) c
+                WHERE s.guild_id = c.guild_id AND s.user_id = c.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        *EVENT_ENTRIES_HISTORY,
+        *EVENT_ENTRIES_INDEXES,
+    ]),
+    (12, "team totals on wins changes only", [
+        # Every registration updates its player's event_count and recent_events;
+        # only wins changes should reach team_totals. Transition tables can't be
+        # combined with an UPDATE OF column list, so the function filters instead.
+        """
+        CREATE OR REPLACE FUNCTION stats_team_totals() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(COALESCE(n.wins, 0)::bigint - COALESCE(o.wins, 0)))
+                FROM old_rows o
+                JOIN new_rows n ON n.guild_id = o.guild_id AND n.user_id = o.user_id
+                JOIN team_members tm ON tm.guild_id = n.guild_id AND tm.user_id = n.user_id
+                WHERE o.wins IS DISTINCT FROM n.wins;
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(-o.wins::bigint))
+                FROM old_rows o JOIN team_members tm ON tm.guild_id = o.guild_id AND tm.user_id = o.user_id;
+            ELSE
+                PERFORM team_totals_add(array_agg(tm.team_id), array_agg(n.wins::bigint))
+                FROM new_rows n JOIN team_members tm ON tm.guild_id = n.guild_id AND tm.user_id = n.user_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# (description, relation that must be reached through an index, query, args)
+HOT_QUERIES = [
+    ("team by name", "teams", "SELECT id FROM teams WHERE guild_id = $1 AND LOWER(name) = LOWER($2)", [1, "Chaos"]),
+    ("team members", "team_members", "SELECT user_id FROM team_members WHERE team_id = $1", [1]),
+    ("user teams", "team_members",
+     "SELECT team_id FROM team_members WHERE guild_id = $1 AND user_id = ANY($2::text[])", [1, ["0", "1"]]),
+    ("user history page", "event_entries",
+     """
+     SELECT id, event_name FROM event_entries
+     WHERE guild_id = $1 AND user_id = $2 AND event_name IS NOT NULL AND id > $3
+     ORDER BY id LIMIT 25
+     """,
+     [1, "0", 0]),
+    ("user placements", "event_entries",
+     "SELECT br_placement FROM event_entries WHERE guild_id = $1 AND user_id = $2 AND br_placement IS NOT NULL ORDER BY id",
+     [1, "0"]),
+]
+
+# The migration that assigns pre-existing rows to home_guild_id.
+GUILD_SCOPING_VERSION = 9
+
+async def _has_legacy_rows(conn):
+    return await conn.fetchval(
+        """
+        SELECT EXISTS (SELECT 1 FROM stats) OR EXISTS (SELECT 1 FROM event_entries)
+            OR EXISTS (SELECT 1 FROM teams) OR EXISTS (SELECT 1 FROM team_members)
+        """
+    )
+
+async def migrate(conn, home_guild_id=0):
+    """
+    Bring the database to SCHEMA_VERSION. Safe to call from several processes
+    at once. home_guild_id is the guild that owns rows created before stats
+    were scoped per guild; it is required when such rows exist, and nothing
+    is assigned to guild 0.
+    """
+    await conn.execute("SELECT set_config('app.home_guild_id', $1, false)", str(home_guild_id or 0))
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    for version, name, statements in MIGRATIONS:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+            applied = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM schema_migrations WHERE version = $1)", version)
+            if applied:
+                continue
+            if version == GUILD_SCOPING_VERSION and not home_guild_id and await _has_legacy_rows(conn):
+                raise RuntimeError(
+                    "Existing stats, events and teams must be assigned to a guild before "
+                    f"schema migration {version}; set HOME_GUILD_ID to the server they belong to."
+                )
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.execute("INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name)
+            logger.info(f"Applied schema migration {version}: {name}")
+    return await conn.fetchval("SELECT MAX(version) FROM schema_migrations")
+
+def _seq_scans(plan, relation):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") == relation:
+        found.append(plan)
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child, relation))
+    return found
+
+async def check_query_plans(conn):
+    """
+    EXPLAIN every hot query with sequential scans disabled and return the ones
+    that still scan their table, i.e. have no usable index. Tiny tables are
+    always seq-scanned by the planner, so this checks that an index path
+    exists rather than which one the planner picks today.
+    """
+    problems = []
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for description, relation, query, args in HOT_QUERIES:
+            raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+            plan = json.loads(raw)[0]["Plan"]
+            if _seq_scans(plan, relation):
+                problems.append(description)
+    return problems
+
+async def partition_by_guild(conn, partitions=8):
+    """
+    Optionally rebuild event_entries as a table hash-partitioned on guild_id,
+    so each guild's history lives in a smaller partition. Runs in one
+    transaction under an exclusive lock; returns False if already partitioned.
+    """
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE event_entries IN ACCESS EXCLUSIVE MODE")
+        kind = await conn.fetchval("SELECT relkind FROM pg_class WHERE oid = 'event_entries'::regclass")
+        if kind == "p":
+            return False
+        sequence = await conn.fetchval("SELECT pg_get_serial_sequence('event_entries', 'id')")
+        await conn.execute("ALTER TABLE event_entries RENAME TO event_entries_unpartitioned")
+        await conn.execute(
+            """
+            CREATE TABLE event_entries (LIKE event_entries_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY HASH (guild_id)
+            """
+        )
+        await conn.execute("ALTER TABLE event_entries ADD PRIMARY KEY (guild_id, id)")
+        for remainder in range(partitions):
+            await conn.execute(
+                f"""
+                CREATE TABLE event_entries_p{remainder} PARTITION OF event_entries
+                FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})
+                """
+            )
+        # No triggers exist on the new table yet, so the stored counters are untouched.
+        await conn.execute("INSERT INTO event_entries SELECT * FROM event_entries_unpartitioned")
+        await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY event_entries.id")
+        await conn.execute("DROP TABLE event_entries_unpartitioned")
+        for statement in EVENT_ENTRIES_INDEXES + EVENT_ENTRIES_TRIGGERS + EVENT_ENTRIES_HISTORY + EVENT_ENTRIES_NOTIFY:
+            await conn.execute(statement)
+    await conn.execute("ANALYZE event_entries")
+    return True
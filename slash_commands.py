@@ -1 +1,118 @@
+import time
+import discord
+from discord import app_commands
+from discord.ext import commands
 
+class SlashCommands(commands.Cog):
+    """
+    Slash versions of the most used commands. Each one builds a Context from
+    the interaction and runs the prefix command, so both entry points share
+    one implementation, checks and perf hooks. Run !synccommands once after
+    changing this file to publish the commands to Discord.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @property
+    def event_cog(self):
+        return self.bot.get_cog("EventCog")
+
+    @property
+    def team_cog(self):
+        return self.bot.get_cog("TeamCog")
+
+    async def run(self, interaction, command, *args, **kwargs):
+        """
+        Run a prefix command for an interaction the way the bot would: defer
+        first (commands may wait on locks or the pool past Discord's 3 second
+        deadline), then its checks, the invoke hooks and the error handler.
+        """
+        await interaction.response.defer(thinking=True)
+        ctx = await commands.Context.from_interaction(interaction)
+        ctx.command = command
+        try:
+            await command.can_run(ctx)
+            await command.call_before_hooks(ctx)
+            try:
+                await ctx.invoke(command, *args, **kwargs)
+            except Exception:
+                ctx.command_failed = True
+                raise
+            finally:
+                await command.call_after_hooks(ctx)
+        except commands.CommandError as error:
+            self.bot.dispatch("command_error", ctx, error)
+        except Exception as error:
+            self.bot.dispatch("command_error", ctx, commands.CommandInvokeError(error))
+
+    async def event_autocomplete(self, interaction: discord.Interaction, current: str):
+        started = time.perf_counter()
+        if not self.event_cog or interaction.guild_id is None:
+            return []
+        names = self.event_cog.names_for(interaction.guild_id)
+        if names is None:
+            # Still building; answering now beats timing out the interaction.
+            return []
+        names = names.complete(current)
+        self.bot.perf.observe("autocomplete", "wall_ms", (time.perf_counter() - started) * 1000)
+        return [app_commands.Choice(name=name[:100], value=name[:100]) for name in names]
+
+    async def team_autocomplete(self, interaction: discord.Interaction, current: str):
+        if not self.team_cog or interaction.guild_id is None:
+            return []
+        current = current.lower()
+        teams = await self.team_cog.guild_teams(interaction.guild_id)
+        return [app_commands.Choice(name=team, value=team) for team in teams if team.lower().startswith(current)][:25]
+
+    @app_commands.command(name="stats", description="Show the wins leaderboard, or one player's stats")
+    @app_commands.describe(player="Show this player's stats instead of the leaderboard")
+    async def stats_slash(self, interaction: discord.Interaction, player: discord.Member = None):
+        await self.run(interaction, self.event_cog.stats, player)
+
+    @app_commands.command(name="search", description="Show who has played a game mode, newest first")
+    @app_commands.autocomplete(game_name=event_autocomplete)
+    async def search_slash(self, interaction: discord.Interaction, game_name: str):
+        await self.run(interaction, self.event_cog.search, game_name=game_name)
+
+    @app_commands.command(name="eventreg", description="Log an event for a player")
+    @app_commands.describe(
+        battle_royal="Whether the event was a battle royal",
+        date="Event date, e.g. 7/25 or 7/25/2025",
+        placement="Battle royal placement, e.g. 1st"
+    )
+    @app_commands.autocomplete(event_name=event_autocomplete)
+    @app_commands.default_permissions(administrator=True)
+    async def eventreg_slash(self, interaction: discord.Interaction, player: discord.Member, event_name: str,
+                             battle_royal: bool, date: str, placement: str = None):
+        if battle_royal:
+            args = ("true", placement, date)
+        else:
+            args = ("false", date)
+        await self.run(interaction, self.event_cog.eventreg, player, event_name, *args)
+
+    @app_commands.command(name="bulkreg", description="Log a non-battle royal win for several players")
+    @app_commands.describe(players="Mentions or ids of every player, separated by spaces")
+    @app_commands.autocomplete(event_name=event_autocomplete)
+    @app_commands.default_permissions(administrator=True)
+    async def bulkreg_slash(self, interaction: discord.Interaction, players: str, event_name: str, date: str):
+        await self.run(interaction, self.event_cog.bulkreg, *players.split(), event_name, date)
+
+    @app_commands.command(name="teamstats", description="Show a team's stats, or your own team's")
+    @app_commands.autocomplete(team_name=team_autocomplete)
+    async def teamstats_slash(self, interaction: discord.Interaction, team_name: str = None):
+        await self.run(interaction, self.team_cog.teamstats, team_name=team_name)
+
+    @app_commands.command(name="leaderboard", description="Show the team leaderboard by points")
+    async def leaderboard_slash(self, interaction: discord.Interaction):
+        await self.run(interaction, self.team_cog.leaderboard)
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def synccommands(self, ctx):
+        """Publish the slash commands to Discord."""
+        synced = await self.bot.tree.sync()
+        await ctx.send(f"✅ Synced {len(synced)} slash commands.")
+
+async def setup(bot):
+    await bot.add_cog(SlashCommands(bot))
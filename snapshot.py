@@ -0,0 +1,70 @@
+"""
+Ranked, read-only standings for one guild, built with two queries.
+
+A Snapshot is never modified after it is built; readers keep using the one
+they hold while a newer one is built, so nothing needs locking.
+"""
+import time
+
+PLAYERS = """
+    SELECT s.user_id, s.wins, s.br_count, COALESCE(s.marathon_wins, 0) AS marathon_wins,
+           RANK() OVER (ORDER BY s.wins DESC, s.br_count DESC) AS rank,
+           COALESCE(p.br_placements, '{}') AS br_placements,
+           t.name AS team, t.emoji AS team_emoji
+    FROM stats s
+    LEFT JOIN team_members tm ON tm.guild_id = s.guild_id AND tm.user_id = s.user_id
+    LEFT JOIN teams t ON t.id = tm.team_id
+    LEFT JOIN (
+        SELECT user_id, array_agg(br_placement ORDER BY id) AS br_placements
+        FROM event_entries
+        WHERE guild_id = $1 AND br_placement IS NOT NULL
+        GROUP BY user_id
+    ) p ON p.user_id = s.user_id
+    WHERE s.guild_id = $1
+    ORDER BY s.wins DESC, s.br_count DESC, s.user_id DESC
+"""
+
+class Snapshot:
+    __slots__ = ("guild_id", "players", "teams", "positions", "team_ranks", "team_positions", "built_at", "build_ms")
+
+    def __init__(self, guild_id, players, teams, build_ms=0.0):
+        self.guild_id = guild_id
+        self.players = tuple(players)
+        self.teams = tuple(teams)
+        self.positions = {row["user_id"]: i for i, row in enumerate(self.players)}
+        # Teams tied on points share a rank, like players tied on wins and BR count.
+        self.team_ranks = []
+        for i, team in enumerate(self.teams):
+            tied = i and team["points"] == self.teams[i - 1]["points"]
+            self.team_ranks.append(self.team_ranks[-1] if tied else i + 1)
+        self.team_positions = {team["name"]: i for i, team in enumerate(self.teams)}
+        self.built_at = time.time()
+        self.build_ms = build_ms
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+    def player(self, user_id):
+        """The player's leaderboard row (with its rank), or None."""
+        i = self.positions.get(str(user_id))
+        return None if i is None else self.players[i]
+
+    def team(self, name):
+        """(rank, team row) for a team name, or (None, None)."""
+        i = self.team_positions.get(name)
+        return (None, None) if i is None else (self.team_ranks[i], self.teams[i])
+
+    def page(self, page, per_page):
+        start = (page - 1) * per_page
+        return self.players[start:start + per_page]
+
+    def pages(self, per_page):
+        return max(1, (len(self.players) - 1) // per_page + 1)
+
+async def build_snapshot(conn, guild_id):
+    started = time.perf_counter()
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        players = await conn.fetch(PLAYERS, guild_id)
+        teams = await conn.fetch_named("team_standings", guild_id, None)
+    return Snapshot(guild_id, players, teams, (time.perf_counter() - started) * 1000)
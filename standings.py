@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+import discord
+from discord.ext import commands, tasks
+from snapshot import build_snapshot
+
+logger = logging.getLogger(__name__)
+
+REFRESH_MINUTES = 5
+# Snapshots nobody has read for this long are dropped instead of refreshed;
+# the next read rebuilds them.
+IDLE_SECONDS = 30 * 60
+# Rebuild once writes to a guild have been quiet this long, but never leave
+# a busy guild's snapshot more than MAX_STALE_SECONDS behind.
+QUIET_SECONDS = 2
+MAX_STALE_SECONDS = 10
+
+class StandingsCog(commands.Cog):
+    """
+    Keeps a ranked Snapshot of every guild's player and team standings
+    (see snapshot.py). Writes reported by the change listener mark a guild
+    dirty and it is rebuilt once they settle. Snapshots are built on first
+    read, refreshed on a timer while they are being read, and evicted once
+    idle. !stats, !leaderboard and !rank read the snapshot instead of
+    querying the standings themselves.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.snapshots = {}
+        self.used = {}
+        self.dirty = {}
+        self.building = {}
+
+    async def cog_load(self):
+        if self.bot.changes:
+            self.bot.changes.subscribe(self.on_db_change)
+        self.refresh_active.start()
+        self.refresh_dirty.start()
+
+    async def cog_unload(self):
+        if self.bot.changes:
+            self.bot.changes.unsubscribe(self.on_db_change)
+        self.refresh_active.cancel()
+        self.refresh_dirty.cancel()
+
+    async def cog_check(self, ctx):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        return True
+
+    def on_db_change(self, change):
+        if change.guild_id is None:
+            for guild_id in self.snapshots:
+                self.mark_dirty(guild_id)
+        elif change.guild_id in self.snapshots:
+            self.mark_dirty(change.guild_id)
+
+    def mark_dirty(self, guild_id):
+        now = time.monotonic()
+        first, _ = self.dirty.get(guild_id, (now, now))
+        self.dirty[guild_id] = (first, now)
+
+    async def snapshot(self, guild_id):
+        """The guild's current snapshot, built now if there isn't one yet."""
+        self.used[guild_id] = time.monotonic()
+        snapshot = self.snapshots.get(guild_id)
+        if snapshot is None:
+            snapshot = await self.rebuild(guild_id)
+        self.bot.perf.observe("standings snapshot", "age_s", snapshot.age)
+        return snapshot
+
+    async def rebuild(self, guild_id):
+        task = self.building.get(guild_id)
+        if task is None:
+            task = self.building[guild_id] = asyncio.create_task(self._build(guild_id))
+        return await asyncio.shield(task)
+
+    async def _build(self, guild_id):
+        # Writes that land while building mark the guild dirty again.
+        self.dirty.pop(guild_id, None)
+        try:
+            async with self.bot.pool.acquire() as conn:
+                snapshot = await build_snapshot(conn, guild_id)
+        except Exception:
+            self.mark_dirty(guild_id)
+            raise
+        finally:
+            del self.building[guild_id]
+        self.snapshots[guild_id] = snapshot
+        self.bot.perf.observe("standings snapshot", "build_ms", snapshot.build_ms)
+        return snapshot
+
+    @tasks.loop(seconds=1)
+    async def refresh_dirty(self):
+        now = time.monotonic()
+        for guild_id, (first, last) in list(self.dirty.items()):
+            if guild_id not in self.snapshots:
+                # Evicted, or never built successfully; the next read builds it.
+                self.dirty.pop(guild_id, None)
+                continue
+            if now - last < QUIET_SECONDS and now - first < MAX_STALE_SECONDS:
+                continue
+            try:
+                await self.rebuild(guild_id)
+            except Exception:
+                logger.exception(f"Rebuilding standings for guild {guild_id} failed")
+
+    @tasks.loop(minutes=REFRESH_MINUTES)
+    async def refresh_active(self):
+        now = time.monotonic()
+        for guild_id in list(self.snapshots):
+            if now - self.used.get(guild_id, 0) > IDLE_SECONDS:
+                self.snapshots.pop(guild_id, None)
+                self.used.pop(guild_id, None)
+                self.dirty.pop(guild_id, None)
+                continue
+            try:
+                await self.rebuild(guild_id)
+            except Exception:
+                logger.exception(f"Rebuilding standings for guild {guild_id} failed")
+
+    @refresh_dirty.before_loop
+    @refresh_active.before_loop
+    async def before_refresh(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command()
+    async def rank(self, ctx, member: discord.Member = None):
+        """Show a player's leaderboard rank, and their team's."""
+        member = member or ctx.author
+        snapshot = await self.snapshot(ctx.guild.id)
+        row = snapshot.player(member.id)
+        if row is None:
+            await ctx.send(f"No stats found for {member.display_name}.")
+            return
+
+        message = (
+            f"🏅 **{member.display_name}** is ranked **#{row['rank']}** of {len(snapshot.players)} "
+            f"with {row['wins']} wins."
+        )
+        team_rank, team = snapshot.team(row['team'])
+        if team:
+            message += f"\nTeam {team['emoji'] or ''} **{team['name']}** is **#{team_rank}** with {team['points']} points."
+        await ctx.send(message)
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+
+class StatsCache:
+    """
+    In-memory cache in front of the stats/event_entries tables.
+
+    Holds per-user stats, LRU bounded. Every write path calls invalidate()
+    after its statement commits. Loads pass the version they started at, so
+    a read that raced with a write never repopulates the cache with stale
+    rows. Leaderboard pages come from the standings snapshot instead.
+    """
+
+    def __init__(self, max_users=2048, on_invalidate=None):
+        self.max_users = max_users
+        self.on_invalidate = on_invalidate
+        self.users = OrderedDict()
+        self.version = 0
+
+    def get_user(self, user_id):
+        data = self.users.get(user_id)
+        if data is not None:
+            self.users.move_to_end(user_id)
+        return data
+
+    def set_user(self, user_id, data, version):
+        if version != self.version:
+            return
+        self.users[user_id] = data
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        self.version += 1
+        for user_id in user_ids:
+            self.users.pop(user_id, None)
+        if self.on_invalidate:
+            self.on_invalidate()
+
+    def clear(self):
+        self.version += 1
+        self.users.clear()
+        if self.on_invalidate:
+            self.on_invalidate()
@@ -1,7 +1,9 @@
+import os
 import discord
 from discord.ext import commands
 from discord import ui
 import asyncpg
+from queries import lock_guild_writes
 
 TEAM_POINTS = {
     '1st': 100,
@@ -13,6 +15,11 @@ TEAM_POINTS = {
 PRESET_TEAMS = ['Chaos', 'Revel', 'Hearth', 'Honor']
 MEMBER_CAP = 10
 
+# The preset emojis are custom emojis of the home server and only render
+# there; other servers get the preset teams without emoji and set their own
+# with !teamemoji.
+HOME_GUILD_ID = int(os.getenv("HOME_GUILD_ID", "0"))
+
 TEAM_EMOJIS = {
     "Chaos": "<:chaos:1404549946694307924>",
     "Revel": "<:revel:1404549965421871265>",
@@ -21,141 +28,284 @@ TEAM_EMOJIS = {
 }
 
 class TeamCog(commands.Cog):
-    TEAM_EMOJIS = {
-        "Chaos": "<:chaos:1404549946694307924>",
-        "Revel": "<:revel:1404549965421871265>",
-        "Hearth": "<:hearth:1404549986850443334>",
-        "Honor": "<:honor:1404550005573943346>",
-    }
     def __init__(self, bot, pool):
         self.bot = bot
         self.pool = pool
+        self.teams = {}
 
-    def get_emoji_for_team(self, team_name: str) -> str:
-        return TEAM_EMOJIS.get(team_name, "")
+    async def cog_check(self, ctx):
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage()
+        return True
 
-    async def user_has_events(self, user_id: str) -> bool:
+    async def cog_load(self):
+        async with self.pool.acquire() as conn:
+            changed = await conn.fetch(
+                """
+                INSERT INTO team_points (placement, points)
+                SELECT * FROM unnest($1::text[], $2::int[])
+                ON CONFLICT (placement) DO UPDATE SET points = EXCLUDED.points
+                WHERE team_points.points IS DISTINCT FROM EXCLUDED.points
+                RETURNING placement
+                """,
+                list(TEAM_POINTS.keys()), list(TEAM_POINTS.values())
+            )
+            initialized = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM team_totals)")
+        if changed or not initialized:
+            await self.reconcile_team_totals()
+        if self.bot.changes:
+            self.bot.changes.subscribe(self.on_db_change)
+
+    async def cog_unload(self):
+        if self.bot.changes:
+            self.bot.changes.unsubscribe(self.on_db_change)
+
+    def on_db_change(self, change):
+        if change.table is None:
+            self.teams.clear()
+        elif change.table == "teams":
+            self.teams.pop(change.guild_id, None)
+
+    async def guild_teams(self, guild_id: int):
+        """
+        {team name: emoji} for a guild. A guild without any teams starts with
+        the preset teams; admins manage them with !teamadd, !teamemoji and
+        !teamremove. The result is cached per guild.
+        """
+        teams = self.teams.get(guild_id)
+        if teams is None:
+            emojis = [TEAM_EMOJIS[name] if guild_id == HOME_GUILD_ID else None for name in PRESET_TEAMS]
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO teams (guild_id, name, emoji)
+                    SELECT $1, * FROM unnest($2::text[], $3::text[])
+                    WHERE NOT EXISTS (SELECT 1 FROM teams WHERE guild_id = $1)
+                    ON CONFLICT (guild_id, name) DO NOTHING
+                    """,
+                    guild_id, PRESET_TEAMS, emojis
+                )
+                rows = await conn.fetch("SELECT name, emoji FROM teams WHERE guild_id = $1 ORDER BY id", guild_id)
+            teams = self.teams[guild_id] = {r['name']: r['emoji'] or "" for r in rows}
+        return teams
+
+    def teams_changed(self, guild_id: int):
+        self.teams.pop(guild_id, None)
+        self.bot.renders.bump(guild_id)
+
+    def check_emoji(self, guild, emoji: str):
+        """Return an error message if emoji is a custom emoji this server can't show."""
+        partial = discord.PartialEmoji.from_str(emoji)
+        if partial.id is None:
+            return None
+        if guild.get_emoji(partial.id) is None:
+            return f"❌ {emoji} isn't an emoji of this server."
+        return None
+
+    async def get_emoji_for_team(self, guild_id: int, team_name: str) -> str:
+        return (await self.guild_teams(guild_id)).get(team_name, "")
+
+    async def user_has_events(self, guild_id: int, user_id: str) -> bool:
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT events FROM stats WHERE user_id = $1", user_id)
-            if row and row['events']:
-                return len(row['events']) > 0
-            return False
+            return await conn.fetchval_named("user_has_events", guild_id, user_id)
 
-    async def get_team_id(self, team_name: str):
+    async def get_team_id(self, guild_id: int, team_name: str):
+        await self.guild_teams(guild_id)
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT id FROM teams WHERE LOWER(name) = LOWER($1)", team_name)
+            row = await conn.fetchrow_named("team_id_by_name", guild_id, team_name)
             return row['id'] if row else None
 
-    async def get_user_team(self, user_id: str):
+    async def get_user_team(self, guild_id: int, user_id: str):
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT team_id FROM team_members WHERE user_id = $1", user_id)
+            row = await conn.fetchrow_named("user_team", guild_id, user_id)
             return row['team_id'] if row else None
 
-    async def get_team_name_by_id(self, team_id: int):
+    async def get_user_teams(self, guild_id: int, user_ids):
+        """Map each user id to their team name with one query; users without a team are left out."""
+        if not user_ids:
+            return {}
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch_named("user_teams", guild_id, list(user_ids))
+            return {r['user_id']: r['name'] for r in rows}
+
+    async def get_team_name_by_id(self, guild_id: int, team_id: int):
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT name FROM teams WHERE id = $1", team_id)
+            row = await conn.fetchrow_named("team_name", guild_id, team_id)
             return row['name'] if row else None
 
-    async def get_team_members(self, team_id: int):
+    async def get_team_members(self, guild_id: int, team_id: int):
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT user_id FROM team_members WHERE team_id = $1", team_id)
+            rows = await conn.fetch_named("team_members", guild_id, team_id)
             return [r['user_id'] for r in rows]
 
-    async def get_stats_for_users(self, user_ids):
-        if not user_ids:
-            return {}
+    async def get_team_standings(self, guild_id: int, team_id=None):
+        """Points, wins, placement histogram and members for a guild's teams (or one team), read from team_totals."""
+        await self.guild_teams(guild_id)
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT user_id, wins, br_placements FROM stats WHERE user_id = ANY($1::text[])", user_ids)
-            data = {}
-            for row in rows:
-                data[row['user_id']] = {
-                    "wins": row['wins'] or 0,
-                    "br_placements": row['br_placements'] or []
-                }
-            return data
-
-    def calculate_points(self, wins, br_placements):
-        points = wins * 100
-        for placement in br_placements:
-            points += TEAM_POINTS.get(placement.lower(), 0)
-        return points
+            return await conn.fetch_named("team_standings", guild_id, team_id)
+
+    async def reconcile_team_totals(self, guild_id=None):
+        """
+        Rebuild team_totals/team_placements of a guild (default: every guild,
+        one at a time) from stats, event_entries and team_members. Returns the
+        teams whose stored counters had drifted.
+        """
+        if guild_id is None:
+            async with self.pool.acquire() as conn:
+                guild_ids = [r['guild_id'] for r in await conn.fetch("SELECT DISTINCT guild_id FROM teams ORDER BY guild_id")]
+            drift = []
+            for gid in guild_ids:
+                drift.extend(await self.reconcile_team_totals(gid))
+            return drift
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await lock_guild_writes(conn, [guild_id], exclusive=True)
+                await conn.execute(
+                    """
+                    CREATE TEMP TABLE expected_placements (team_id INTEGER, placement TEXT, count BIGINT) ON COMMIT DROP;
+                    CREATE TEMP TABLE expected_totals (team_id INTEGER, wins BIGINT, points BIGINT) ON COMMIT DROP
+                    """
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO expected_placements
+                    SELECT tm.team_id, lower(e.br_placement) AS placement, COUNT(*)::bigint AS count
+                    FROM team_members tm
+                    JOIN event_entries e ON e.guild_id = tm.guild_id AND e.user_id = tm.user_id
+                    WHERE tm.guild_id = $1 AND e.br_placement IS NOT NULL
+                    GROUP BY tm.team_id, lower(e.br_placement)
+                    """,
+                    guild_id
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO expected_totals
+                    SELECT t.id AS team_id, w.wins,
+                           w.wins * 100 + COALESCE((
+                               SELECT SUM(ep.count * tp.points) FROM expected_placements ep
+                               JOIN team_points tp ON tp.placement = ep.placement
+                               WHERE ep.team_id = t.id
+                           ), 0) AS points
+                    FROM teams t
+                    CROSS JOIN LATERAL (
+                        SELECT COALESCE(SUM(s.wins), 0)::bigint AS wins
+                        FROM team_members tm JOIN stats s ON s.guild_id = tm.guild_id AND s.user_id = tm.user_id
+                        WHERE tm.team_id = t.id
+                    ) w
+                    WHERE t.guild_id = $1
+                    """,
+                    guild_id
+                )
+                drift = await conn.fetch(
+                    """
+                    SELECT t.guild_id, t.name, t.emoji, COALESCE(tt.wins, 0) AS stored_wins, e.wins AS expected_wins,
+                           COALESCE(tt.points, 0) AS stored_points, e.points AS expected_points
+                    FROM expected_totals e
+                    JOIN teams t ON t.id = e.team_id
+                    LEFT JOIN team_totals tt ON tt.team_id = e.team_id
+                    WHERE tt.team_id IS NULL OR tt.wins <> e.wins OR tt.points <> e.points
+                    ORDER BY t.guild_id, t.name
+                    """
+                )
+                await conn.execute(
+                    "DELETE FROM team_placements WHERE team_id IN (SELECT id FROM teams WHERE guild_id = $1)", guild_id
+                )
+                await conn.execute("INSERT INTO team_placements (team_id, placement, count) SELECT team_id, placement, count FROM expected_placements")
+                await conn.execute(
+                    """
+                    INSERT INTO team_totals (team_id, wins, points)
+                    SELECT team_id, wins, points FROM expected_totals
+                    ON CONFLICT (team_id) DO UPDATE
+                    SET wins = EXCLUDED.wins, points = EXCLUDED.points
+                    """
+                )
+                return drift
 
     @commands.command()
     async def join(self, ctx, *, team_name: str):
         user_id = str(ctx.author.id)
         team_name = team_name.strip()
 
-        if team_name.lower() not in (t.lower() for t in PRESET_TEAMS):
-            await ctx.send(f"❌ Team `{team_name}` does not exist. Choose from: {', '.join(PRESET_TEAMS)}")
+        guild_id = ctx.guild.id
+        teams = await self.guild_teams(guild_id)
+        team_name = next((name for name in teams if name.lower() == team_name.lower()), team_name)
+        if team_name not in teams:
+            await ctx.send(f"❌ Team `{team_name}` does not exist. Choose from: {', '.join(teams)}")
             return
 
-        if not await self.user_has_events(user_id):
+        if not await self.user_has_events(guild_id, user_id):
             await ctx.send("❌ You must have at least one event recorded before joining a team.")
             return
 
-        current_team_id = await self.get_user_team(user_id)
+        current_team_id = await self.get_user_team(guild_id, user_id)
         if current_team_id is not None:
-            current_team_name = await self.get_team_name_by_id(current_team_id)
+            current_team_name = await self.get_team_name_by_id(guild_id, current_team_id)
             await ctx.send(f"❌ You are already in the team `{current_team_name}`. Leave it first to join another.")
             return
 
-        team_id = await self.get_team_id(team_name)
-        members = await self.get_team_members(team_id)
+        team_id = await self.get_team_id(guild_id, team_name)
+        members = await self.get_team_members(guild_id, team_id)
         if len(members) >= MEMBER_CAP:
             await ctx.send(f"❌ Team `{team_name}` is full (max {MEMBER_CAP} members).")
             return
 
-        async with self.pool.acquire() as conn:
+        async with self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, [guild_id])
             await conn.execute(
-                "INSERT INTO team_members (user_id, team_id) VALUES ($1, $2) ON CONFLICT (user_id) DO UPDATE SET team_id = EXCLUDED.team_id",
-                user_id, team_id
+                """
+                INSERT INTO team_members (guild_id, user_id, team_id) VALUES ($1, $2, $3)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET team_id = EXCLUDED.team_id
+                """,
+                guild_id, user_id, team_id
             )
-        await ctx.send(f"✅ You joined team {self.get_emoji_for_team(team_name)} `{team_name}`!")
+        self.bot.renders.bump(guild_id)
+        await ctx.send(f"✅ You joined team {teams[team_name]} `{team_name}`!")
 
     @commands.command()
     async def leave(self, ctx):
         user_id = str(ctx.author.id)
-        current_team_id = await self.get_user_team(user_id)
+        guild_id = ctx.guild.id
+        current_team_id = await self.get_user_team(guild_id, user_id)
         if current_team_id is None:
             await ctx.send("❌ You are not currently in any team.")
             return
 
-        async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM team_members WHERE user_id = $1", user_id)
+        async with self.pool.acquire() as conn, conn.transaction():
+            await lock_guild_writes(conn, [guild_id])
+            await conn.execute("DELETE FROM team_members WHERE guild_id = $1 AND user_id = $2", guild_id, user_id)
+        self.bot.renders.bump(guild_id)
 
-        team_name = await self.get_team_name_by_id(current_team_id)
-        await ctx.send(f"✅ You left the team {self.get_emoji_for_team(team_name)} `{team_name}`.")
+        team_name = await self.get_team_name_by_id(guild_id, current_team_id)
+        await ctx.send(f"✅ You left the team {await self.get_emoji_for_team(guild_id, team_name)} `{team_name}`.")
 
     @commands.command()
     async def teamstats(self, ctx, *, team_name: str = None):
         if team_name is None:
             user_id = str(ctx.author.id)
-            team_id = await self.get_user_team(user_id)
+            team_id = await self.get_user_team(ctx.guild.id, user_id)
             if team_id is None:
                 await ctx.send("❌ You are not in any team. Specify a team name like `!teamstats <teamname>`.")
                 return
         else:
-            team_id = await self.get_team_id(team_name)
+            team_id = await self.get_team_id(ctx.guild.id, team_name)
             if team_id is None:
                 await ctx.send(f"❌ Team `{team_name}` does not exist.")
                 return
 
-        members = await self.get_team_members(team_id)
-        if not members:
+        standings = await self.get_team_standings(ctx.guild.id, team_id)
+        if not standings or not standings[0]['members']:
             await ctx.send("❌ This team has no members.")
             return
 
-        stats = await self.get_stats_for_users(members)
-
-        total_wins = sum(user.get("wins", 0) for user in stats.values())
-        total_br_placements = []
-        for user in stats.values():
-            total_br_placements.extend(user.get("br_placements", []))
-
-        total_points = self.calculate_points(total_wins, total_br_placements)
+        team = standings[0]
+        members = team['members']
+        total_wins = team['wins']
+        total_br_placements = team['br_placements']
+        total_points = team['points']
 
-        team_name = await self.get_team_name_by_id(team_id)
-        emoji = self.get_emoji_for_team(team_name)
+        team_name = team['name']
+        emoji = team['emoji'] or ""
 
         embed = discord.Embed(
             title=f"Stats for Team {emoji} {team_name}",
@@ -167,9 +317,10 @@ class TeamCog(commands.Cog):
         embed.add_field(name="Total Points", value=str(total_points), inline=False)
         embed.add_field(name="Members Count", value=str(len(members)), inline=False)
 
+        resolved = await self.bot.members.resolve(ctx.guild, members[:10])
         member_mentions = []
         for uid in members[:10]:
-            member = ctx.guild.get_member(int(uid))
+            member = resolved.get(uid)
             if member:
                 member_mentions.append(member.mention)
             else:
@@ -180,39 +331,36 @@ class TeamCog(commands.Cog):
 
     @commands.command()
     async def leaderboard(self, ctx):
-        async with self.pool.acquire() as conn:
-            teams = await conn.fetch("SELECT id, name FROM teams")
-
-        if not teams:
+        await self.guild_teams(ctx.guild.id)
+        snapshot = await self.bot.get_cog("StandingsCog").snapshot(ctx.guild.id)
+        embed = await self.bot.renders.render(
+            "teams", ctx.guild.id, snapshot.built_at, 1, lambda: self.leaderboard_embed(ctx.guild, snapshot)
+        )
+        if embed is None:
             await ctx.send("❌ No teams found.")
             return
+        await ctx.send(embed=embed)
 
-        leaderboard = []
-
-        for team in teams:
-            team_id = team['id']
-            team_name = team['name']
-            members = await self.get_team_members(team_id)
-            stats = await self.get_stats_for_users(members)
-            total_wins = sum(user.get("wins", 0) for user in stats.values())
-            total_br_placements = []
-            for user in stats.values():
-                total_br_placements.extend(user.get("br_placements", []))
-            total_points = self.calculate_points(total_wins, total_br_placements)
-            emoji = self.get_emoji_for_team(team_name)
-            leaderboard.append((emoji, team_name, total_points, members))
+    async def leaderboard_embed(self, guild, snapshot):
+        teams = snapshot.teams
+        if not teams:
+            return None
 
-        leaderboard.sort(key=lambda x: x[2], reverse=True)
+        leaderboard = [
+            (rank, team['emoji'] or "", team['name'], team['points'], team['members'])
+            for rank, team in zip(snapshot.team_ranks, teams)
+        ]
 
         embed = discord.Embed(
             title="Team Leaderboard",
             color=discord.Color.dark_teal()
         )
 
-        for idx, (emoji, team_name, points, members) in enumerate(leaderboard, start=1):
+        resolved = await self.bot.members.resolve(guild, [uid for team in teams for uid in team['members']])
+        for rank, emoji, team_name, points, members in leaderboard:
             member_mentions = []
             for uid in members:
-                member = ctx.guild.get_member(int(uid))
+                member = resolved.get(uid)
                 if member:
                     member_mentions.append(member.mention)
                 else:
@@ -221,20 +369,85 @@ class TeamCog(commands.Cog):
             members_text = ", ".join(member_mentions) if member_mentions else "No members"
 
             embed.add_field(
-                name=f"{idx}. {emoji} {team_name} - {points} points",
+                name=f"{rank}. {emoji} {team_name} - {points} points",
                 value=f"Members:\n{members_text}",
                 inline=False
             )
 
             embed.add_field(name="\u200b", value="\u200b", inline=False)
 
-        await ctx.send(embed=embed)
+        return embed
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def teamreconcile(self, ctx):
+        """Rebuild the stored team counters from raw data and report any drift."""
+        drift = await self.reconcile_team_totals(ctx.guild.id)
+        if not drift:
+            await ctx.send("✅ Team totals are consistent with the raw stats.")
+            return
+        lines = [
+            f"- {row['emoji'] or ''} {row['name']}: wins {row['stored_wins']} → {row['expected_wins']}, "
+            f"points {row['stored_points']} → {row['expected_points']}"
+            for row in drift
+        ]
+        await ctx.send("⚠️ Fixed drift in team totals:\n" + "\n".join(lines))
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def teamadd(self, ctx, name: str, emoji: str = None):
+        """Create a team in this server, optionally with an emoji."""
+        name = name.strip()
+        teams = await self.guild_teams(ctx.guild.id)
+        if any(existing.lower() == name.lower() for existing in teams):
+            return await ctx.send(f"❌ Team `{name}` already exists.")
+        problem = self.check_emoji(ctx.guild, emoji) if emoji else None
+        if problem:
+            return await ctx.send(problem)
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "INSERT INTO teams (guild_id, name, emoji) VALUES ($1, $2, $3)",
+                ctx.guild.id, name, emoji
+            )
+        self.teams_changed(ctx.guild.id)
+        await ctx.send(f"✅ Created team {emoji or ''} `{name}`.")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def teamemoji(self, ctx, name: str, emoji: str = None):
+        """Set (or with no emoji, clear) a team's emoji."""
+        problem = self.check_emoji(ctx.guild, emoji) if emoji else None
+        if problem:
+            return await ctx.send(problem)
+        async with self.pool.acquire() as conn:
+            status = await conn.execute(
+                "UPDATE teams SET emoji = $3 WHERE guild_id = $1 AND LOWER(name) = LOWER($2)",
+                ctx.guild.id, name, emoji
+            )
+        if status == "UPDATE 0":
+            return await ctx.send(f"❌ Team `{name}` does not exist.")
+        self.teams_changed(ctx.guild.id)
+        await ctx.send(f"✅ Emoji for `{name}` {'set to ' + emoji if emoji else 'cleared'}.")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def teamremove(self, ctx, *, name: str):
+        """Delete a team that has no members."""
+        team_id = await self.get_team_id(ctx.guild.id, name.strip())
+        if team_id is None:
+            return await ctx.send(f"❌ Team `{name}` does not exist.")
+        if await self.get_team_members(ctx.guild.id, team_id):
+            return await ctx.send(f"❌ Team `{name}` still has members.")
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM teams WHERE guild_id = $1 AND id = $2", ctx.guild.id, team_id)
+        self.teams_changed(ctx.guild.id)
+        await ctx.send(f"✅ Removed team `{name}`.")
 
     @commands.command()
     async def tlist(self, ctx):
         commands_list = (
             "**Team Commands:**\n"
-            "- **!join <team_name>** - Join a preset team (Chaos, Revel, Hearth, Honor). Must have at least one event.\n"
+            "- **!join <team_name>** - Join one of this server's teams. Must have at least one event.\n"
             "- **!leave** - Leave your current team.\n"
             "- **!teamstats [team_name]** - Show stats of a team or your own team if no name provided.\n"
             "- **!leaderboard** - Show leaderboard of all teams by points.\n"
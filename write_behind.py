@@ -0,0 +1,198 @@
+"""
+Write-behind queue for event registrations.
+
+Each op is appended to a local journal (and fsynced) before the command is
+acknowledged, then flushed to Postgres in batches every max_delay_ms or as
+soon as max_ops are waiting. After a flush the journal is rewritten with
+whatever is still pending. On startup any journalled ops are replayed first.
+Every op carries an op_id that event_entries stores under a unique index,
+so replaying ops that had already been committed is a no-op.
+
+When a batch fails its ops are retried one at a time. Ops the database
+rejects outright (bad data, constraint violations) are moved to a
+dead-letter file next to the journal so they can't block the rest; ops
+that failed for any other reason stay queued and are retried with a
+growing delay, up to MAX_BACKOFF seconds.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import date
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 30
+# Failures that retrying the same op can never fix.
+PERMANENT_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError, ValueError, TypeError, KeyError)
+
+def new_op_id():
+    return uuid.uuid4().hex
+
+def encode_op(op):
+    return json.dumps({**op, "event_date": op["event_date"].isoformat() if op["event_date"] else None})
+
+def decode_op(line):
+    op = json.loads(line)
+    op["event_date"] = date.fromisoformat(op["event_date"]) if op["event_date"] else None
+    return op
+
+class WriteBehindQueue:
+    def __init__(self, write, path, max_delay_ms=250, max_ops=100):
+        self.write = write
+        self.path = path
+        self.max_delay = max_delay_ms / 1000
+        self.max_ops = max_ops
+        self.pending = []
+        self.pending_users = Counter()
+        self._file = None
+        self._io = asyncio.Lock()
+        self._flushing = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task = None
+        self.failures = 0
+
+    def has_pending(self, *keys):
+        """Whether any (guild_id, user_id) in keys has ops waiting to be flushed."""
+        return any(self.pending_users[key] for key in keys)
+
+    def _read_journal(self):
+        if not os.path.exists(self.path):
+            return []
+        ops = []
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    ops.append(decode_op(line))
+                except (ValueError, KeyError):
+                    # A torn final line from a crash mid-append was never acknowledged.
+                    logger.warning(f"Skipping unreadable journal line {number} in {self.path}")
+        return ops
+
+    def _append(self, ops):
+        self._file.write("".join(encode_op(op) + "\n" for op in ops))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rewrite(self, ops):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(encode_op(op) + "\n" for op in ops))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _dead_letter(self, rejected):
+        with open(self.path + ".dead", "a", encoding="utf-8") as f:
+            f.write("".join(
+                json.dumps({"op": json.loads(encode_op(op)), "error": repr(error)}) + "\n"
+                for op, error in rejected
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _track(self, ops, delta):
+        for op in ops:
+            key = (op["guild_id"], op["user_id"])
+            self.pending_users[key] += delta
+            if self.pending_users[key] <= 0:
+                del self.pending_users[key]
+
+    async def start(self):
+        """Replay anything left in the journal, then start the flush loop."""
+        replay = await asyncio.to_thread(self._read_journal)
+        await asyncio.to_thread(self._rewrite, replay)
+        if replay:
+            self.pending.extend(replay)
+            self._track(replay, 1)
+            try:
+                await self.flush()
+                logger.info(f"Replayed {len(replay)} journalled registrations from {self.path}")
+            except Exception:
+                logger.exception(f"Replaying {len(replay)} journalled registrations failed; retrying in the background")
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, ops):
+        """Journal ops durably; they are written to the database on the next flush."""
+        async with self._io:
+            await asyncio.to_thread(self._append, ops)
+            self.pending.extend(ops)
+            self._track(ops, 1)
+        if len(self.pending) >= self.max_ops:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            delay = min(MAX_BACKOFF, self.max_delay * 2 ** self.failures)
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self.pending:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception(f"Write-behind flush of {len(self.pending)} ops failed; retrying in {delay:.1f}s")
+
+    async def flush(self):
+        """
+        Write everything pending. Raises if some ops could not be written for
+        a reason other than the database rejecting them; those stay queued.
+        """
+        async with self._flushing:
+            batch = self.pending[:]
+            if not batch:
+                return
+            written, rejected, error = batch, [], None
+            try:
+                await self.write(batch)
+            except Exception as e:
+                logger.warning(f"Write-behind batch of {len(batch)} ops failed ({e!r}); retrying them one by one")
+                written, rejected, error = await self._write_singly(batch)
+            done = written + [op for op, _ in rejected]
+            async with self._io:
+                if rejected:
+                    await asyncio.to_thread(self._dead_letter, rejected)
+                    logger.error(f"Moved {len(rejected)} rejected registrations to {self.path}.dead")
+                done_ids = {op["op_id"] for op in done}
+                self.pending[:] = [op for op in self.pending if op["op_id"] not in done_ids]
+                self._track(done, -1)
+                await asyncio.to_thread(self._rewrite, self.pending[:])
+            if error is not None:
+                self.failures += 1
+                raise error
+            self.failures = 0
+
+    async def _write_singly(self, batch):
+        written, rejected, error = [], [], None
+        for op in batch:
+            try:
+                await self.write([op])
+            except PERMANENT_ERRORS as e:
+                rejected.append((op, e))
+            except Exception as e:
+                error = e
+            else:
+                written.append(op)
+        return written, rejected, error
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None